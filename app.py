@@ -1,11 +1,14 @@
 # app.py
-from flask import Flask, render_template, jsonify
-import sqlite3
-from datetime import datetime
-from apscheduler.schedulers.background import BackgroundScheduler
-from scraper import scrape_all_products  # Import your scraping function
+from flask import Flask, render_template, jsonify, request, abort
+from datetime import datetime, timedelta
+from downsample import lttb
+from storage import get_repository
+from price_index import PriceIndex
+from changes import change_records
 import logging
 import atexit
+import os
+import threading
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,82 +16,166 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Chart payload limits for the price history page
+DEFAULT_CHART_POINTS = 200
+MAX_CHART_POINTS = 1000
+MIN_SERIES_POINTS = 20
+
+# Page sizes for the /api/changes feed
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+# Bounds for /api/cheapest and /api/top-deals
+MAX_DEALS_LIMIT = 100
+MAX_CHEAPEST_DAYS = 3650
+
+# Latest deals per product, kept in memory and refreshed from new price_history rows
+_price_index = None
+
+# Set SCHEDULER_ENABLED=0 for processes that should only serve (tests, extra workers)
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') != '0'
+
+def get_price_index():
+    """The shared price index, created on first use.
+
+    Creating it builds the repository, which for PostgreSQL opens a connection
+    pool with its own threads, so this must not happen at import time.
+    """
+    global _price_index
+    if _price_index is None:
+        _price_index = PriceIndex(get_repository())
+    return _price_index
+
 def get_product_data():
-    """Get latest product data from database"""
-    conn = sqlite3.connect('price_tracker.db')
-    c = conn.cursor()
-    
-    products_data = []
-    c.execute('SELECT id, name, url FROM products')
-    for product_id, product_name, product_url in c.fetchall():
-        c.execute('''
-            SELECT shop_name, price, amount, price_per_gram, expiration, shops_valid, 
-                    additional_note, fetch_timestamp
-            FROM price_history
-            WHERE product_id = ? AND fetch_timestamp = (
-                SELECT MAX(fetch_timestamp) FROM price_history WHERE product_id = ?
-            )
-            ORDER BY price_per_gram ASC
-            LIMIT 3
-        ''', (product_id, product_id))
-        
-        deals = [{
-            'shop_name': row[0],
-            'price': row[1],
-            'amount': row[2],
-            'price_per_gram': row[3],
-            'expiration': row[4],
-            'shops_valid': row[5],
-            'additional_note': row[6],
-            'fetch_timestamp': row[7]
-        } for row in c.fetchall()]
-        
-        products_data.append({
-            'id': product_id,
-            'name': product_name,
-            'url': product_url,
-            'deals': deals
-        })
-    
-    conn.close()
-    return products_data
+    """Get latest product data from the in-memory price index"""
+    price_index = get_price_index()
+    price_index.refresh_if_stale()
+    return price_index.get_product_data(deals_per_product=3)
 
-def get_price_history(product_id):
-    """Get price history for a specific product"""
-    conn = sqlite3.connect('price_tracker.db')
-    c = conn.cursor()
+def get_price_history(product_id, start=None, end=None, shop=None, per_shop=False,
+                      max_points=DEFAULT_CHART_POINTS):
+    """Get downsampled price history for a specific product.
+
+    The daily lowest price is returned either as one series (optionally
+    limited to a single shop) or as one series per shop. Every series is
+    downsampled so the payload stays bounded by max_points no matter how
+    long the product has been tracked.
+    """
+    repo = get_repository()
     
     # Get product details
-    c.execute('SELECT name, url FROM products WHERE id = ?', (product_id,))
-    product_name, product_url = c.fetchone()
+    product = repo.get_product(product_id)
+    if product is None:
+        return None
     
-    # Get price history - lowest price per day
-    c.execute('''
-        SELECT 
-            date(fetch_timestamp) as date,
-            MIN(price) as lowest_price,
-            GROUP_CONCAT(shop_name) as shops
-        FROM price_history
-        WHERE product_id = ?
-        GROUP BY date(fetch_timestamp)
-        ORDER BY date
-    ''', (product_id,))
+    series = {}
+    for point in repo.daily_lowest_prices(product_id, start=start, end=end, shop=shop,
+                                          per_shop=per_shop):
+        key = point['shops'] if per_shop else 'Lowest Price'
+        series.setdefault(key, []).append(point)
     
-    history = [{
-        'date': row[0],
-        'price': row[1],
-        'shops': row[2].split(',')[0]  # Take first shop name for simplicity
-    } for row in c.fetchall()]
+    # Split the point budget between the series, keeping a usable minimum each
+    budget = max(min(MIN_SERIES_POINTS, max_points), max_points // max(len(series), 1))
+    series = {name: downsample_history(points, budget) for name, points in series.items()}
     
-    conn.close()
     return {
-        'name': product_name,
-        'url': product_url,
-        'history': history
+        'name': product['name'],
+        'url': product['url'],
+        'shops': repo.product_shops(product_id),
+        'series': series
     }
 
+def downsample_history(points, max_points):
+    """Reduce a daily price series to at most max_points using LTTB"""
+    if len(points) <= max_points:
+        return points
+    xs = [datetime.strptime(p['date'], '%Y-%m-%d').toordinal() for p in points]
+    ys = [p['price'] for p in points]
+    return [points[i] for i in lttb(xs, ys, max_points)]
+
+def parse_date_arg(args, name):
+    """Read an optional YYYY-MM-DD query parameter, aborting with 400 if malformed"""
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        abort(400, f"Invalid {name} date, expected YYYY-MM-DD")
+
+def history_filters(args):
+    """get_price_history keyword arguments from the history page's query string"""
+    max_points = args.get('points', DEFAULT_CHART_POINTS, type=int)
+    return {
+        'start': parse_date_arg(args, 'start'),
+        'end': parse_date_arg(args, 'end'),
+        'shop': args.get('shop') or None,
+        'per_shop': args.get('per_shop') == '1',
+        'max_points': min(max(max_points, 2), MAX_CHART_POINTS)
+    }
+
+def cheapest_filters(args):
+    """cheapest_deals keyword arguments from /api/cheapest's query string, aborting with 400 on bad days"""
+    days = args.get('days', type=int)
+    if days is not None and not 1 <= days <= MAX_CHEAPEST_DAYS:
+        abort(400, f"days must be between 1 and {MAX_CHEAPEST_DAYS}")
+    return {
+        'name_query': args.get('q'),
+        'unit': args.get('unit', 'g'),
+        'since': (datetime.now() - timedelta(days=days)).isoformat() if days else None,
+        'limit': min(max(args.get('limit', 10, type=int), 1), MAX_DEALS_LIMIT)
+    }
+
+def get_changes_page(since, limit):
+    """One page of the change feed after the cursor since.
+
+    data_generation changes when existing rows are rewritten (merges, unit
+    updates), which the feed does not replay; mirrors then resync from 0.
+    """
+    # Read before the rows: a rewrite racing this page shows up on the next one
+    generation = get_repository().data_generation()
+    # Fetch one extra row to know whether another page follows
+    rows = get_repository().history_since(since, limit=limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'changes': change_records(get_repository(), rows) if rows else [],
+        'next_since': rows[-1]['id'] if rows else since,
+        'has_more': has_more,
+        'data_generation': generation
+    }
+
+# Route bodies shared by the WSGI routes below and asgi.py, which runs them on
+# its DB threads; each reads the query string and returns JSON-ready data
+
+def get_basket(args):
+    """Basket cost per shop for the product_id parameters, aborting with 400 if none"""
+    product_ids = args.getlist('product_id', type=int)
+    if not product_ids:
+        abort(400, "At least one product_id is required")
+    return get_repository().basket_cost_by_shop(product_ids)
+
+def get_cheapest_deals(args):
+    return get_repository().cheapest_deals(**cheapest_filters(args))
+
+def get_top_deals(args):
+    n = min(max(args.get('n', 10, type=int), 1), MAX_DEALS_LIMIT)
+    price_index = get_price_index()
+    price_index.refresh_if_stale()
+    return price_index.top_deals(n=n, unit=args.get('unit', 'g'))
+
+def get_changes(args):
+    since = args.get('since', 0, type=int)
+    limit = min(max(args.get('limit', DEFAULT_CHANGES_LIMIT, type=int), 1), MAX_CHANGES_LIMIT)
+    return get_changes_page(since, limit)
+
+def get_shop_leaderboard():
+    return get_repository().shop_leaderboard()
+
 def scrape_job():
     """Function to be scheduled for scraping"""
+    # The scraper pulls in requests and bs4, so load it only when a job runs
+    from scraper import scrape_all_products
     try:
         logger.info("Starting scheduled scraping job")
         scrape_all_products()
@@ -96,19 +183,51 @@ def scrape_job():
     except Exception as e:
         logger.error(f"Error in scheduled scraping job: {str(e)}")
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=scrape_job, 
-                 trigger="interval", 
-                 days=2,
-                 id='scraping_job',
-                 name='Scrape product prices every 2 days')
+scheduler = None
+_started = False
+_startup_lock = threading.Lock()
 
-# Start the scheduler
-scheduler.start()
+def start_background_services(scrape_now=False):
+    """Prepare the database and start the scraping scheduler, once per process.
 
-# Shut down the scheduler when exiting the app
-atexit.register(lambda: scheduler.shutdown())
+    Nothing here runs at import time; it is triggered by the first request
+    (or by __main__), so importing the app stays cheap.
+    """
+    global scheduler, _started
+    with _startup_lock:
+        if _started:
+            return
+        
+        # Make sure the schema (including later added columns) is up to date
+        get_repository().setup()
+        get_price_index().rebuild()
+        
+        # _started is only set once everything succeeded, so a failure here is
+        # retried by the next request instead of leaving the scheduler unstarted
+        if not SCHEDULER_ENABLED:
+            _started = True
+            return
+        from apscheduler.schedulers.background import BackgroundScheduler
+        
+        # Run the first scrape in the background instead of delaying startup
+        first_run = {'next_run_time': datetime.now()} if scrape_now else {}
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(func=scrape_job, 
+                         trigger="interval", 
+                         days=2,
+                         id='scraping_job',
+                         name='Scrape product prices every 2 days',
+                         **first_run)
+        scheduler.start()
+        _started = True
+        
+        # Shut down the scheduler when exiting the app
+        atexit.register(lambda: scheduler.shutdown())
+
+@app.before_request
+def ensure_background_services():
+    if not _started:
+        start_background_services()
 
 @app.route('/')
 def index():
@@ -117,15 +236,41 @@ def index():
 
 @app.route('/product/<int:product_id>/history')
 def product_history(product_id):
-    history_data = get_price_history(product_id)
-    return render_template('price_history.html', product=history_data)
+    filters = history_filters(request.args)
+    history_data = get_price_history(product_id, **filters)
+    if history_data is None:
+        abort(404)
+    return render_template('price_history.html', product=history_data, filters=filters)
+
+@app.route('/api/basket')
+def api_basket():
+    """Basket cost per shop, e.g. /api/basket?product_id=1&product_id=2"""
+    return jsonify(get_basket(request.args))
+
+@app.route('/api/cheapest')
+def api_cheapest():
+    """Top-N current deals by price per unit, e.g. /api/cheapest?q=čokoláda&days=7"""
+    return jsonify(get_cheapest_deals(request.args))
+
+@app.route('/api/top-deals')
+def api_top_deals():
+    """Cheapest current deals by price per unit, served from the in-memory index"""
+    return jsonify(get_top_deals(request.args))
+
+@app.route('/api/changes')
+def api_changes():
+    """Records added after a cursor, e.g. /api/changes?since=1200&limit=500"""
+    return jsonify(get_changes(request.args))
+
+@app.route('/api/shops/leaderboard')
+def api_shop_leaderboard():
+    return jsonify(get_shop_leaderboard())
 
 if __name__ == '__main__':
-    # Run initial scrape when starting the app (optional)
-    try:
-        logger.info("Running initial scrape on startup")
-        scrape_job()
-    except Exception as e:
-        logger.error(f"Error in initial scrape: {str(e)}")
+    # This is the WSGI (Werkzeug) mode; see asgi.py for the ASGI one
+    # With debug=True the reloader re-runs this module in a child process that
+    # does the serving; only start the scheduler (and initial scrape) there
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services(scrape_now=True)
     
     app.run(debug=True)
\ No newline at end of file
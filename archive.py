@@ -0,0 +1,130 @@
+# archive.py
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import zstandard
+
+from matching import NameIndex
+from storage import Repository, create_repository, get_repository
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get(
+    'PRICE_ARCHIVE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+)
+COMPRESSION_LEVEL = 10
+
+def archive_path(sha256: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    # Fan out over subdirectories so no single directory grows huge
+    return os.path.join(archive_dir, sha256[:2], f'{sha256}.html.zst')
+
+def store_page(html: bytes, archive_dir: str = ARCHIVE_DIR) -> str:
+    """Compress and store a fetched page under its SHA-256, returning the hash.
+
+    Identical pages share one file, so re-fetching an unchanged page costs
+    nothing but the catalog row.
+    """
+    sha256 = hashlib.sha256(html).hexdigest()
+    path = archive_path(sha256, archive_dir)
+    if os.path.exists(path):
+        return sha256
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(html)
+    # Write aside and rename, so concurrent writers never expose a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(compressed)
+    os.replace(tmp_path, path)
+    return sha256
+
+def load_page(sha256: str, archive_dir: str = ARCHIVE_DIR) -> bytes:
+    with open(archive_path(sha256, archive_dir), 'rb') as archived:
+        return zstandard.ZstdDecompressor().decompress(archived.read())
+
+def parse_archived_page(page: Dict,
+                        archive_dir: str = ARCHIVE_DIR) -> Tuple[Dict, Optional[Dict], Optional[str]]:
+    """Run an archived page through its source's parser (in a worker process).
+
+    Returns (page, product_data, error); a page that cannot be loaded or
+    parsed yields an error message instead of failing the whole batch.
+    """
+    from sources import get_source
+    try:
+        html = load_page(page['sha256'], archive_dir)
+        return page, get_source(page['source']).parse_product(html, page['url']), None
+    except Exception as e:
+        return page, None, f"{type(e).__name__}: {e}"
+
+def reparse_archive(repo: Repository, since: Optional[str] = None, until: Optional[str] = None,
+                    workers: Optional[int] = None, include_saved: bool = False,
+                    dry_run: bool = False, archive_dir: str = ARCHIVE_DIR) -> int:
+    """Replay archived pages through the current parsers and backfill price_history.
+
+    By default only fetches that saved no rows (e.g. after a markup change
+    broke the parser) are replayed, stamped with their original fetch time.
+    Pages that still fail to load or parse are logged and skipped. Each page
+    is name-matched and deduped against its fetch run like a live scrape.
+    Returns the number of rows written (or that would be).
+    """
+    # Imported here: scraper imports this module to archive what it fetches
+    from scraper import save_page
+
+    names = NameIndex.from_repository(repo)
+    pages = repo.archived_pages(since=since, until=until, only_empty=not include_saved)
+    logger.info(f"Reparsing {len(pages)} archived pages")
+
+    written = 0
+    failed = 0
+    # Pages come in fetched_at order; offers saved per product for the run
+    # (fetch time) being replayed, so one run's offers are stored once
+    run, saved_offers = None, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(parse_archived_page, pages, [archive_dir] * len(pages), chunksize=16)
+        for page, product_data, error in results:
+            if error is not None:
+                logger.error(f"Error reparsing {page['url']} ({page['sha256']}): {error}")
+                failed += 1
+                continue
+            if not product_data['discounts']:
+                continue
+            if dry_run:
+                written += len(product_data['discounts'])
+                continue
+            if page['fetched_at'] != run:
+                run, saved_offers = page['fetched_at'], {}
+            save_page(repo, names, saved_offers, page['id'], page['url'], product_data, page['fetched_at'])
+            written += len(product_data['discounts'])
+
+    logger.info(f"{'Would write' if dry_run else 'Wrote'} {written} price_history rows")
+    if failed:
+        logger.warning(f"{failed} archived pages could not be reparsed")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description='Reparse archived pages to backfill price history')
+    parser.add_argument('--since', help='First fetch date to replay (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Last fetch date to replay (YYYY-MM-DD)')
+    parser.add_argument('--workers', type=int, help='Parser processes (defaults to CPU count)')
+    parser.add_argument('--include-saved', action='store_true',
+                        help='Also replay fetches that already saved rows (may duplicate them)')
+    parser.add_argument('--dry-run', action='store_true', help='Parse without writing')
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    args = parser.parse_args()
+
+    repo = create_repository(args.db) if args.db else get_repository()
+    repo.setup()
+    reparse_archive(repo, since=args.since, until=args.until, workers=args.workers,
+                    include_saved=args.include_saved, dry_run=args.dry_run)
+    repo.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# asgi.py
+import argparse
+
+from quart import Quart, render_template, jsonify, request, abort
+
+import app as views
+import async_db
+from async_db import run_db
+
+# ASGI serving mode: the same pages and API as app.py, but requests wait on the
+# database without tying up a worker. Serve with `hypercorn asgi:app`, or run
+# `python asgi.py` for a single local process.
+app = Quart(__name__)
+
+@app.before_serving
+async def start_background_services():
+    await run_db(views.start_background_services)
+
+@app.after_serving
+async def stop_db_threads():
+    async_db.shutdown()
+
+@app.route('/')
+async def index():
+    products = await async_db.get_product_data()
+    return await render_template('index.html', products=products)
+
+@app.route('/product/<int:product_id>/history')
+async def product_history(product_id):
+    filters = views.history_filters(request.args)
+    history_data = await async_db.get_price_history(product_id, **filters)
+    if history_data is None:
+        abort(404)
+    return await render_template('price_history.html', product=history_data, filters=filters)
+
+@app.route('/api/basket')
+async def api_basket():
+    """Basket cost per shop, e.g. /api/basket?product_id=1&product_id=2"""
+    return jsonify(await run_db(views.get_basket, request.args))
+
+@app.route('/api/cheapest')
+async def api_cheapest():
+    """Top-N current deals by price per unit, e.g. /api/cheapest?q=čokoláda&days=7"""
+    return jsonify(await run_db(views.get_cheapest_deals, request.args))
+
+@app.route('/api/top-deals')
+async def api_top_deals():
+    """Cheapest current deals by price per unit, served from the in-memory index"""
+    return jsonify(await run_db(views.get_top_deals, request.args))
+
+@app.route('/api/changes')
+async def api_changes():
+    """Records added after a cursor, e.g. /api/changes?since=1200&limit=500"""
+    return jsonify(await run_db(views.get_changes, request.args))
+
+@app.route('/api/shops/leaderboard')
+async def api_shop_leaderboard():
+    return jsonify(await run_db(views.get_shop_leaderboard))
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the price tracker over ASGI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    app.run(host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
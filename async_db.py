@@ -0,0 +1,28 @@
+# async_db.py
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import app as views
+
+# Threads running blocking repository calls for the ASGI app. This also caps
+# how many database connections requests can hold at once.
+DB_THREADS = int(os.environ.get('DB_THREADS', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database call on the DB thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def get_product_data():
+    return await run_db(views.get_product_data)
+
+async def get_price_history(product_id, **filters):
+    # Downsampling runs on the DB thread too, so long histories never stall the loop
+    return await run_db(views.get_price_history, product_id, **filters)
+
+def shutdown():
+    _executor.shutdown(wait=False)
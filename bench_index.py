@@ -0,0 +1,59 @@
+# bench_index.py
+import argparse
+import gc
+import time
+import tracemalloc
+
+from price_index import PriceIndex
+from storage import create_repository, get_repository
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns, with its result kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+def timed(func, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the in-memory price index')
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    repo = create_repository(args.db) if args.db else get_repository()
+    repo.setup()
+
+    def build_index():
+        index = PriceIndex(repo)
+        index.rebuild()
+        return index
+
+    index, index_bytes = retained_bytes(build_index)
+    rows, rows_bytes = retained_bytes(lambda: repo.latest_history(repo.max_history_id()))
+    deals = max(index.deal_count(), 1)
+
+    print(f"{index.deal_count()} deals across {len(index.products)} products")
+    print(f"PriceIndex:        {index_bytes / deals:8.1f} bytes/deal ({index_bytes / 1024:.0f} KiB)")
+    print(f"Row dicts:         {rows_bytes / deals:8.1f} bytes/deal ({rows_bytes / 1024:.0f} KiB)")
+
+    def from_repository():
+        return [dict(product, deals=repo.latest_deals(product['id'], limit=3))
+                for product in repo.list_products()]
+
+    print(f"get_product_data:  index {timed(index.get_product_data, args.runs):.2f} ms, "
+          f"database {timed(from_repository, args.runs):.2f} ms")
+    print(f"top 10 deals:      index {timed(index.top_deals, args.runs):.2f} ms, "
+          f"database {timed(repo.cheapest_deals, args.runs):.2f} ms")
+
+if __name__ == '__main__':
+    main()
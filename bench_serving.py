@@ -0,0 +1,130 @@
+# bench_serving.py
+import argparse
+import http.client
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+from storage import create_repository, get_repository
+
+# Servers are started from these commands; {port} is filled in
+WSGI_COMMAND = [sys.executable, '-c', 'from app import app; app.run(port={port})']
+ASGI_COMMAND = [sys.executable, '-m', 'hypercorn', 'asgi:app', '--bind', '127.0.0.1:{port}']
+
+STARTUP_TIMEOUT = 30
+
+def start_server(command, port: int, db: Optional[str] = None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SCHEDULER_ENABLED='0')
+    if db:
+        env['DATABASE_URL'] = db
+    return subprocess.Popen([part.format(port=port) for part in command], cwd=here, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_until_ready(port: int, process):
+    """Poll until the server answers (the first request also runs its startup)"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {STARTUP_TIMEOUT}s")
+
+def load(port: int, paths, concurrency: int, duration: float):
+    """Request paths round-robin from concurrent clients, returning latencies and errors"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        connection = None
+        mine = []
+        failed = 0
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+                    continue
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection.close()
+                    connection = None
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection = None
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+def report(name: str, latencies, errors: int, duration: float):
+    if not latencies:
+        print(f"{name}: no successful requests ({errors} errors)")
+        return
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name}: {len(latencies) / duration:8.1f} req/s, "
+          f"p50 {statistics.median(ordered) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, {errors} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare requests/sec of the WSGI and ASGI serving modes')
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per server')
+    parser.add_argument('--port', type=int, default=5081)
+    parser.add_argument('--wsgi-command', help='Override the WSGI server command ({port} is filled in)')
+    parser.add_argument('--asgi-command', help='Override the ASGI server command ({port} is filled in)')
+    args = parser.parse_args()
+
+    # The dashboard plus the history page of a few products
+    repo = create_repository(args.db) if args.db else get_repository()
+    product_ids = [product['id'] for product in repo.list_products()[:5]]
+    repo.close()
+    paths = ['/'] + [f'/product/{product_id}/history' for product_id in product_ids]
+
+    servers = [
+        ('WSGI', shlex.split(args.wsgi_command) if args.wsgi_command else WSGI_COMMAND),
+        ('ASGI', shlex.split(args.asgi_command) if args.asgi_command else ASGI_COMMAND),
+    ]
+    print(f"{len(paths)} paths, {args.concurrency} concurrent clients, {args.duration:.0f}s each")
+    for name, command in servers:
+        process = start_server(command, args.port, args.db)
+        try:
+            wait_until_ready(args.port, process)
+            latencies, errors = load(args.port, paths, args.concurrency, args.duration)
+            report(name, latencies, errors, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# bench_startup.py
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Optional
+
+# Modules that belong to the scraping/scheduling stack or to a database
+# driver, none of which importing the app should load
+HEAVY_MODULES = ['requests', 'bs4', 'apscheduler', 'scraper', 'psycopg', 'psycopg_pool']
+
+# Importing must not open the database, whichever backend DATABASE_URL selects
+# (the Postgres host does not exist, so nothing can quietly connect to it)
+PROBE_DATABASES = [
+    ('sqlite', ''),
+    ('postgres', 'postgresql://import-probe.invalid/price_tracker'),
+]
+
+PROBE = '''
+import json, sys, threading, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_ms": elapsed * 1000,
+                  "heavy": [m for m in %r if m in sys.modules],
+                  "threads": [t.name for t in threading.enumerate() if t is not threading.main_thread()]}))
+'''
+
+def measure_import(runs: int, database_url: Optional[str] = None):
+    """Import app in fresh interpreters and collect wall times, heavy modules and threads"""
+    env = dict(os.environ, SCHEDULER_ENABLED='0')
+    if database_url is not None:
+        env['DATABASE_URL'] = database_url
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE % HEAVY_MODULES],
+                                cwd=here, env=env, capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return results
+
+def top_imports(limit: int):
+    """Slowest modules (cumulative microseconds) according to -X importtime"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, SCHEDULER_ENABLED='0')
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=here, env=env, capture_output=True, text=True, check=True)
+    timings = []
+    for line in output.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how long importing the web app takes')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest imports')
+    parser.add_argument('--max-ms', type=float, help='Exit non-zero if the median import is slower')
+    args = parser.parse_args()
+
+    results = measure_import(args.runs)
+    times = [result['import_ms'] for result in results]
+    median = statistics.median(times)
+    print(f"import app: median {median:.1f} ms, min {min(times):.1f} ms, max {max(times):.1f} ms "
+          f"over {args.runs} runs")
+
+    print("Slowest imports (cumulative):")
+    for cumulative, name in top_imports(args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    for backend, database_url in PROBE_DATABASES:
+        probes = measure_import(1, database_url)
+        heavy = sorted({module for result in probes for module in result['heavy']})
+        threads = sorted({thread for result in probes for thread in result['threads']})
+        if heavy:
+            print(f"FAIL: importing app ({backend}) loaded {', '.join(heavy)}")
+            failed = True
+        if threads:
+            print(f"FAIL: importing app ({backend}) started threads {', '.join(threads)}")
+            failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"FAIL: median import {median:.1f} ms exceeds {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
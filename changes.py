@@ -0,0 +1,67 @@
+# changes.py
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Optional
+
+from storage import Repository, create_repository, get_repository
+
+def iter_changes(repo: Repository, since: int = 0, batch_size: int = 1000,
+                 limit: Optional[int] = None) -> Iterator[Dict]:
+    """Yield records added after the cursor since, oldest first.
+
+    The cursor is the price_history id: every 'price' record carries it, so a
+    consumer resumes from the last cursor it processed. Each batch is preceded
+    by 'product' records for the products it references, so consumers can
+    upsert products before their prices. Only one batch is held in memory.
+    The cursor is gap-free on both backends: SQLite has a single writer and
+    PostgreSQL serializes price_history inserts until commit.
+    The feed is append-only: rows rewritten in place (renormalize, merges) are
+    not replayed. Those bump the repository's data_generation(), which the API
+    and the NDJSON export report; a mirror that sees it change resyncs from 0.
+    """
+    cursor = since
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = repo.history_since(cursor, limit=size)
+        if not rows:
+            break
+
+        yield from change_records(repo, rows)
+
+        cursor = rows[-1]['id']
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < size:
+            break
+
+def change_records(repo: Repository, rows: List[Dict]) -> List[Dict]:
+    """Product records for the referenced products followed by the price records"""
+    product_ids = sorted({row['product_id'] for row in rows})
+    records = [dict(product, type='product') for product in repo.products_by_ids(product_ids)]
+    records.extend(dict(row, type='price', cursor=row['id']) for row in rows)
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream price changes as NDJSON')
+    parser.add_argument('--since', type=int, default=0, help='Cursor (price_history id) to resume after')
+    parser.add_argument('--limit', type=int, help='Stop after this many price records')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    args = parser.parse_args()
+
+    repo = create_repository(args.db) if args.db else get_repository()
+    repo.setup()
+    try:
+        # Read before the rows: a rewrite racing the export shows up next time
+        generation = {'type': 'generation', 'data_generation': repo.data_generation()}
+        sys.stdout.write(json.dumps(generation) + '\n')
+        for record in iter_changes(repo, since=args.since, batch_size=args.batch_size, limit=args.limit):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+    finally:
+        repo.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# downsample.py
+from typing import List, Sequence
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the points to keep (always including the first
+    and last one), so callers can pick the matching rows themselves.
+    """
+    n = len(xs)
+    if threshold >= n or threshold <= 2:
+        if threshold <= 2 and n > 2:
+            return [0, n - 1]
+        return list(range(n))
+
+    kept = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        # Pick the point of the current bucket forming the largest triangle
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        kept.append(best)
+        a = best
+
+    kept.append(n - 1)
+    return kept
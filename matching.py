@@ -0,0 +1,212 @@
+# matching.py
+import argparse
+import hashlib
+import logging
+import random
+import re
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from queries import fold_name
+from storage import Repository, create_repository, get_repository
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Minimum shingle Jaccard similarity for two names to be the same product
+MATCH_THRESHOLD = 0.8
+
+# MinHash signature of BANDS * ROWS values; names agreeing on all ROWS values
+# of any band become candidates (about 0.8 similarity is found ~99% of the time)
+BANDS = 16
+ROWS = 4
+SHINGLE_SIZE = 3
+
+_MERSENNE = (1 << 61) - 1
+# Fixed seed so signatures are stable across processes
+_rng = random.Random(20241115)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE))
+                 for _ in range(BANDS * ROWS)]
+
+# Pack sizes are not part of a product's identity ("160g", "2x 80 g", "1,5 l")
+_QUANTITY_RE = re.compile(
+    r'\b\d+(?:[.,]\d+)?\s*(?:x\s*\d+(?:[.,]\d+)?\s*)?(?:mg|dkg|kg|g|ml|cl|dl|l|ks)\b'
+)
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+# Words that make a different product of an otherwise identical name
+# ("Coca-Cola Zero", "Radegast nealko", "Kofola bez cukru"), after fold_name
+VARIANT_WORDS = frozenset(['zero', 'light', 'decaf', 'bez', 'nealko',
+                           'nealkoholicke', 'nealkoholicky', 'nealkoholicka'])
+
+def normalize_name(name: str) -> List[str]:
+    """Lowercase, diacritic-free tokens without pack sizes, sorted"""
+    text = _QUANTITY_RE.sub(' ', fold_name(name))
+    return sorted(set(token for token in _NON_WORD_RE.split(text) if token))
+
+def identity_tokens(name: str) -> FrozenSet[str]:
+    """Tokens two names must share exactly to be the same product.
+
+    Numbers other than pack sizes ("3%" vs "0%" fat, "12" degree beer) and
+    VARIANT_WORDS change what the product is, yet barely move the shingle
+    similarity of a long name.
+    """
+    return frozenset(token for token in normalize_name(name)
+                     if token in VARIANT_WORDS or any(char.isdigit() for char in token))
+
+def shingles(name: str) -> FrozenSet[str]:
+    """Character n-grams of the normalized name"""
+    text = ' '.join(normalize_name(name))
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+def minhash(shingle_set: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+              for shingle in shingle_set]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS)
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class NameIndex:
+    """MinHash/LSH index over product names.
+
+    Lookups only compare against products sharing an LSH band, so matching a
+    new scrape does not scan the whole catalog. Candidates are confirmed with
+    the exact shingle Jaccard similarity and must have the same identity_tokens.
+    """
+
+    def __init__(self):
+        self.shingles = {}
+        self.identities = {}
+        self.buckets = defaultdict(set)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield band, signature[band * ROWS:(band + 1) * ROWS]
+
+    def add(self, product_id: int, name: str):
+        shingle_set = shingles(name)
+        if not shingle_set:
+            return
+        self.shingles[product_id] = shingle_set
+        self.identities[product_id] = identity_tokens(name)
+        for key in self._band_keys(minhash(shingle_set)):
+            self.buckets[key].add(product_id)
+
+    def candidates(self, name: str) -> Set[int]:
+        shingle_set = shingles(name)
+        if not shingle_set:
+            return set()
+        found = set()
+        for key in self._band_keys(minhash(shingle_set)):
+            found |= self.buckets.get(key, set())
+        return found
+
+    def match(self, name: str, threshold: float = MATCH_THRESHOLD) -> Optional[Tuple[int, float]]:
+        """Most similar indexed product as (product_id, similarity), if above threshold"""
+        shingle_set = shingles(name)
+        identity = identity_tokens(name)
+        best = None
+        for product_id in self.candidates(name):
+            if self.identities[product_id] != identity:
+                continue
+            similarity = jaccard(shingle_set, self.shingles[product_id])
+            if similarity >= threshold and (best is None or similarity > best[1]
+                                            or (similarity == best[1] and product_id < best[0])):
+                best = (product_id, similarity)
+        return best
+
+    @classmethod
+    def from_repository(cls, repo: Repository) -> 'NameIndex':
+        index = cls()
+        for product in repo.list_products():
+            index.add(product['id'], product['name'] or '')
+        return index
+
+def resolve_product_url(repo: Repository, index: NameIndex, url: str, name: str) -> Optional[int]:
+    """Link an unseen URL to an existing product with a matching name.
+
+    Returns the product id the URL now belongs to, or None if it is new (or
+    already known). Saving then stores its history under that product.
+    """
+    if repo.product_id_for_url(url) is not None:
+        return None
+    match = index.match(name)
+    if match is None:
+        return None
+    product_id, similarity = match
+    repo.add_product_alias(url, product_id)
+    logger.info(f"Matched {url} to product {product_id} (similarity {similarity:.2f})")
+    return product_id
+
+def find_duplicates(products: List[Dict], threshold: float = MATCH_THRESHOLD) -> List[List[int]]:
+    """Groups of product ids whose names match, each sorted with the oldest id first"""
+    index = NameIndex()
+    for product in products:
+        index.add(product['id'], product['name'] or '')
+
+    # Union-find over matching pairs
+    parent = {product['id']: product['id'] for product in products}
+
+    def root(product_id):
+        while parent[product_id] != product_id:
+            parent[product_id] = parent[parent[product_id]]
+            product_id = parent[product_id]
+        return product_id
+
+    for product in products:
+        shingle_set = index.shingles.get(product['id'])
+        if not shingle_set:
+            continue
+        identity = index.identities[product['id']]
+        for other_id in index.candidates(product['name'] or ''):
+            if other_id == product['id'] or index.identities[other_id] != identity:
+                continue
+            if jaccard(shingle_set, index.shingles[other_id]) >= threshold:
+                a, b = root(product['id']), root(other_id)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    groups = defaultdict(list)
+    for product_id in parent:
+        groups[root(product_id)].append(product_id)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
+
+def merge_duplicates(repo: Repository, threshold: float = MATCH_THRESHOLD, dry_run: bool = False) -> int:
+    """Merge every group of matching products into its oldest product.
+
+    Returns the number of price_history rows re-linked (0 on a dry run).
+    """
+    products = repo.list_products()
+    names = {product['id']: product['name'] for product in products}
+    relinked = 0
+    for group in find_duplicates(products, threshold):
+        target, duplicates = group[0], group[1:]
+        logger.info(f"{'Would merge' if dry_run else 'Merging'} "
+                    f"{', '.join(repr(names[product_id]) for product_id in duplicates)} "
+                    f"into {names[target]!r}")
+        if not dry_run:
+            relinked += repo.merge_products(target, duplicates)
+    if not dry_run:
+        logger.info(f"Re-linked {relinked} price_history rows")
+    return relinked
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge products that are the same item under different URLs')
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD)
+    parser.add_argument('--dry-run', action='store_true', help='Only list the merges')
+    args = parser.parse_args()
+
+    repo = create_repository(args.db) if args.db else get_repository()
+    repo.setup()
+    merge_duplicates(repo, threshold=args.threshold, dry_run=args.dry_run)
+    repo.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# price_index.py
+import heapq
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from storage import Repository
+
+# Seconds between incremental refreshes triggered by reads
+REFRESH_INTERVAL = 30
+
+# Text fields that repeat across thousands of deals; interned so each
+# distinct value is stored once
+_INTERNED_FIELDS = ('shop_name', 'amount', 'expiration', 'shops_valid',
+                    'additional_note', 'fetch_timestamp', 'unit')
+
+class Deal:
+    """One price_history row of a product's latest snapshot"""
+
+    __slots__ = ('id', 'shop_name', 'price', 'amount', 'price_per_gram', 'expiration',
+                 'shops_valid', 'additional_note', 'fetch_timestamp', 'unit')
+
+    def __init__(self, row: Dict):
+        self.id = row['id']
+        self.price = row['price']
+        self.price_per_gram = row['price_per_gram']
+        for field in _INTERNED_FIELDS:
+            value = row[field]
+            setattr(self, field, sys.intern(value) if isinstance(value, str) else value)
+        if self.unit is None:
+            self.unit = 'g'
+
+    def as_dict(self) -> Dict:
+        """Same shape the templates and the repository use for a deal"""
+        return {
+            'shop_name': self.shop_name,
+            'price': self.price,
+            'amount': self.amount,
+            'price_per_gram': self.price_per_gram,
+            'expiration': self.expiration,
+            'shops_valid': self.shops_valid,
+            'additional_note': self.additional_note,
+            'fetch_timestamp': self.fetch_timestamp,
+            'unit': self.unit
+        }
+
+class ProductEntry:
+    """A product with the deals of its latest snapshot, cheapest per unit first"""
+
+    __slots__ = ('id', 'name', 'url', 'fetch_timestamp', 'deals')
+
+    def __init__(self, product_id: int, name: str, url: str):
+        self.id = product_id
+        self.name = name
+        self.url = url
+        self.fetch_timestamp = None
+        self.deals = ()
+
+class PriceIndex:
+    """Long-lived in-memory view of every product's latest deals.
+
+    Built once from the latest snapshots, then kept current by reading only
+    price_history rows above a high-water mark on id. Readers never hit the
+    database; entries are replaced wholesale so they can read without locks.
+    Rows changed or deleted in place (renormalize, merges) are invisible to
+    the high-water mark, so the index also tracks the repository's
+    data_generation() and rebuilds when it moves.
+    """
+
+    def __init__(self, repo: Repository, refresh_interval: float = REFRESH_INTERVAL):
+        self.repo = repo
+        self.refresh_interval = refresh_interval
+        self.products = {}
+        self.high_water = 0
+        self.generation = None
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        """Load the latest snapshot of every product from scratch"""
+        with self._lock:
+            # Read before loading: a rewrite racing the load just causes another rebuild
+            generation = self.repo.data_generation()
+            high_water = self.repo.max_history_id()
+            # Build aside and swap, so readers never see a half-loaded index
+            products = self._with_new_products({})
+            self._apply(products, self.repo.latest_history(high_water))
+            self.products = products
+            self.high_water = high_water
+            self.generation = generation
+            self.last_refresh = time.monotonic()
+
+    def refresh(self, batch_size: int = 1000) -> int:
+        """Apply price_history rows added since the last refresh, returning how many"""
+        with self._lock:
+            # Products saved without deals have no rows to announce them, but the
+            # dashboard lists every product, so look for new ones each refresh
+            self.products = self._with_new_products(self.products)
+            applied = 0
+            while True:
+                rows = self.repo.history_since(self.high_water, limit=batch_size)
+                if not rows:
+                    break
+                if any(row['product_id'] not in self.products for row in rows):
+                    self.products = self._with_new_products(self.products)
+                self._apply(self.products, rows)
+                self.high_water = rows[-1]['id']
+                applied += len(rows)
+            self.last_refresh = time.monotonic()
+            return applied
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self.last_refresh < self.refresh_interval:
+            return
+        if self.repo.data_generation() != self.generation:
+            self.rebuild()
+        else:
+            self.refresh()
+
+    def _with_new_products(self, products: Dict[int, ProductEntry]) -> Dict[int, ProductEntry]:
+        """Copy of products extended with any product not indexed yet (products itself if none)"""
+        new = [product for product in self.repo.list_products() if product['id'] not in products]
+        if not new:
+            return products
+        products = dict(products)
+        for product in new:
+            products[product['id']] = ProductEntry(product['id'], product['name'], product['url'])
+        return products
+
+    def _apply(self, products: Dict[int, ProductEntry], rows: List[Dict]):
+        # Group first so every touched product is re-sorted once
+        touched = {}
+        for row in rows:
+            entry = products.get(row['product_id'])
+            if entry is None:
+                continue
+            timestamp, deals = touched.get(entry.id, (entry.fetch_timestamp, list(entry.deals)))
+            if timestamp is None or row['fetch_timestamp'] > timestamp:
+                timestamp, deals = row['fetch_timestamp'], []
+            elif row['fetch_timestamp'] < timestamp:
+                continue
+            deals.append(Deal(row))
+            touched[entry.id] = (timestamp, deals)
+
+        for product_id, (timestamp, deals) in touched.items():
+            entry = products[product_id]
+            # Same order as ORDER BY price_per_gram in SQLite (NULLs first)
+            deals.sort(key=lambda deal: (deal.price_per_gram is not None, deal.price_per_gram or 0))
+            entry.fetch_timestamp = sys.intern(timestamp)
+            entry.deals = tuple(deals)
+
+    def get_product_data(self, deals_per_product: int = 3) -> List[Dict]:
+        """Products with their cheapest current deals, like app.get_product_data"""
+        return [{
+            'id': entry.id,
+            'name': entry.name,
+            'url': entry.url,
+            'deals': [deal.as_dict() for deal in entry.deals[:deals_per_product]]
+        } for entry in self.products.values()]
+
+    def top_deals(self, n: int = 10, unit: str = 'g', product_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Cheapest current deals by price per unit across all (or the given) products"""
+        entries = self.products.values() if product_ids is None else \
+            [self.products[pid] for pid in product_ids if pid in self.products]
+        candidates = ((deal.price_per_gram, deal.id, entry, deal)
+                      for entry in entries
+                      for deal in entry.deals
+                      if deal.unit == unit and (deal.price_per_gram or 0) > 0)
+        return [dict(deal.as_dict(), product_id=entry.id, product_name=entry.name)
+                for _, _, entry, deal in heapq.nsmallest(n, candidates)]
+
+    def deal_count(self) -> int:
+        return sum(len(entry.deals) for entry in self.products.values())
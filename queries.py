@@ -0,0 +1,149 @@
+# queries.py
+import sqlite3
+import unicodedata
+from typing import Dict, List, Optional
+
+# Deals from each product's latest scrape. Both the MAX(fetch_timestamp) lookup
+# and the row fetch are answered from idx_price_history_latest alone. CROSS JOIN
+# pins products as the outer loop; without ANALYZE statistics SQLite may
+# otherwise scan the whole index instead.
+LATEST_DEALS = '''
+    SELECT ph.product_id, p.name AS product_name, p.search_name, ph.shop_name, ph.price,
+           ph.price_per_gram, COALESCE(ph.unit, 'g') AS unit, ph.fetch_timestamp
+    FROM products p
+    CROSS JOIN price_history ph
+      ON ph.product_id = p.id
+     AND ph.fetch_timestamp = (
+         SELECT MAX(fetch_timestamp) FROM price_history WHERE product_id = p.id
+     )
+'''
+
+def fold_name(text: str) -> str:
+    """Lowercase text without diacritics ('Čokoláda' -> 'cokolada').
+
+    Stored as products.search_name, so name filters match regardless of
+    case and accents on every backend (SQLite's LIKE only folds ASCII case).
+    """
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+def create_indexes(conn: sqlite3.Connection):
+    """Create the covering indexes the comparison queries rely on"""
+    c = conn.cursor()
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_price_history_latest
+        ON price_history (product_id, fetch_timestamp, shop_name, price, price_per_gram, unit)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_price_history_shop
+        ON price_history (shop_name, product_id, fetch_timestamp)
+    ''')
+    conn.commit()
+
+def basket_cost_by_shop(conn: sqlite3.Connection, product_ids: List[int]) -> List[Dict]:
+    """Cost of a basket at every shop, using each shop's cheapest current deal per product.
+
+    Shops carrying the whole basket come first, cheapest total first; the
+    rest follow ordered by how many items they are missing.
+    """
+    if not product_ids:
+        return []
+    product_ids = sorted(set(product_ids))
+    placeholders = ', '.join('?' for _ in product_ids)
+
+    c = conn.cursor()
+    c.execute(f'''
+        WITH latest AS ({LATEST_DEALS} WHERE p.id IN ({placeholders})),
+        best AS (
+            SELECT shop_name, product_id, MIN(price) AS price
+            FROM latest
+            GROUP BY shop_name, product_id
+        )
+        SELECT shop_name, SUM(price), GROUP_CONCAT(product_id)
+        FROM best
+        GROUP BY shop_name
+    ''', product_ids)
+
+    return summarize_basket(c.fetchall(), product_ids)
+
+def summarize_basket(rows, product_ids: List[int]) -> List[Dict]:
+    """Turn (shop_name, total, 'id,id,...') rows into ordered basket results"""
+    basket = []
+    for shop_name, total, covered in rows:
+        covered_ids = {int(product_id) for product_id in covered.split(',')}
+        basket.append({
+            'shop_name': shop_name,
+            'total': round(total, 2),
+            'items': len(covered_ids),
+            'missing': [product_id for product_id in product_ids if product_id not in covered_ids]
+        })
+
+    basket.sort(key=lambda shop: (len(shop['missing']), shop['total']))
+    return basket
+
+def cheapest_deals(conn: sqlite3.Connection, name_query: Optional[str] = None,
+                   unit: str = 'g', since: Optional[str] = None, limit: int = 10) -> List[Dict]:
+    """Top-N current deals by price per unit.
+
+    name_query narrows the ranking to a product category by name (e.g.
+    'čokoláda', matched ignoring case and diacritics), since drops products
+    whose latest scrape is older than the given ISO date. Only deals in the
+    same base unit are comparable, so the ranking is always within one unit.
+    """
+    where = ['unit = ?', 'price_per_gram > 0']
+    params = [unit]
+    if name_query:
+        where.append('search_name LIKE ?')
+        params.append(f'%{fold_name(name_query)}%')
+    if since:
+        where.append('fetch_timestamp >= ?')
+        params.append(since)
+
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT product_id, product_name, shop_name, price, price_per_gram, unit, fetch_timestamp
+        FROM ({LATEST_DEALS})
+        WHERE {' AND '.join(where)}
+        ORDER BY price_per_gram ASC
+        LIMIT ?
+    ''', params + [limit])
+
+    return [{
+        'product_id': row[0],
+        'product_name': row[1],
+        'shop_name': row[2],
+        'price': row[3],
+        'price_per_gram': row[4],
+        'unit': row[5],
+        'fetch_timestamp': row[6]
+    } for row in c.fetchall()]
+
+def shop_leaderboard(conn: sqlite3.Connection) -> List[Dict]:
+    """Rank shops by how often they have the cheapest current deal per product.
+
+    avg_price_ratio is the shop's price per unit relative to the best price
+    for the same product (1.0 means it matches the cheapest offer).
+    """
+    c = conn.cursor()
+    c.execute(f'''
+        WITH ranked AS (
+            SELECT shop_name, product_id, price_per_gram,
+                   MIN(price_per_gram) OVER (PARTITION BY product_id) AS best
+            FROM ({LATEST_DEALS})
+            WHERE price_per_gram > 0
+        )
+        SELECT shop_name,
+               COUNT(DISTINCT product_id) AS products,
+               COUNT(DISTINCT CASE WHEN price_per_gram = best THEN product_id END) AS cheapest,
+               AVG(price_per_gram / best) AS avg_price_ratio
+        FROM ranked
+        GROUP BY shop_name
+        ORDER BY cheapest DESC, avg_price_ratio ASC
+    ''')
+
+    return [{
+        'shop_name': row[0],
+        'products': row[1],
+        'cheapest': row[2],
+        'avg_price_ratio': round(row[3], 3)
+    } for row in c.fetchall()]
@@ -0,0 +1,42 @@
+# renormalize.py
+import argparse
+import logging
+
+from storage import Repository, create_repository, get_repository
+from units import parse_quantity
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def renormalize_price_history(repo: Repository, dry_run: bool = False) -> int:
+    """Recompute price_per_gram and unit for every price_history row.
+
+    Amount strings repeat heavily, so each distinct one is parsed once and
+    applied with a single set-based UPDATE instead of touching rows one by one.
+    Returns the number of rows whose per-unit price or unit changed.
+    """
+    updates = []
+    for amount in repo.distinct_amounts():
+        quantity, unit = parse_quantity(amount or '')
+        updates.append((amount, quantity, unit))
+
+    changed = repo.apply_unit_updates(updates, dry_run=dry_run)
+
+    logger.info(f"{'Would update' if dry_run else 'Updated'} {changed} rows "
+                f"({len(updates)} distinct amounts)")
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute per-unit prices in price_history')
+    parser.add_argument('--db', help='Database URL or SQLite path (defaults to DATABASE_URL)')
+    parser.add_argument('--dry-run', action='store_true', help='Report without writing changes')
+    args = parser.parse_args()
+
+    repo = create_repository(args.db) if args.db else get_repository()
+    repo.setup()
+    renormalize_price_history(repo, dry_run=args.dry_run)
+    repo.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,174 +1,140 @@
-import requests
-from bs4 import BeautifulSoup
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import re
-from typing import List, Dict
+from typing import List, Dict, Optional, Set, Tuple
 import logging
+from storage import Repository, get_repository
+from sources import SOURCES, KupiSource, Source
+from units import parse_price
+from matching import NameIndex, resolve_product_url
+from archive import store_page
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def setup_database():
-    conn = sqlite3.connect('price_tracker.db')
-    c = conn.cursor()
-    
-    # Create products table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY,
-            url TEXT UNIQUE,
-            name TEXT
-        )
-    ''')
-    
-    # Create price_history table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS price_history (
-            id INTEGER PRIMARY KEY,
-            product_id INTEGER,
-            shop_name TEXT,
-            price REAL,
-            amount TEXT,
-            price_per_gram REAL,
-            expiration TEXT,
-            shops_valid TEXT,
-            additional_note TEXT,
-            fetch_timestamp DATETIME,
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-    ''')
-    
-    conn.commit()
-    return conn
+# Pages fetched in parallel across all sources
+MAX_WORKERS = 4
 
-def parse_amount(amount_str: str) -> float:
-    """Extract numeric value from amount string (e.g., '100 g' -> 100.0)"""
-    match = re.search(r'(\d+(?:\.\d+)?)', amount_str)
-    if match:
-        return float(match.group(1))
-    return 0.0
+def scrape_product(url: str) -> Dict:
+    """Scrape single kupi.cz product page"""
+    return KupiSource().scrape_product(url)
 
-def parse_price(price_str: str) -> float:
-    """Convert price string to float (e.g., '29,90 Kč' -> 29.90)"""
-    price_str = price_str.replace(',', '.').replace('Kč', '').strip()
-    try:
-        return float(price_str)
-    except ValueError:
-        return 0.0
+def offer_key(discount: Dict) -> Tuple:
+    """What makes two pages' discounts the same offer: shop, price, amount and validity.
 
-def scrape_product(url: str) -> Dict:
-    """Scrape single product page"""
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
-    # Get product name
-    product_name = soup.find('h1').get_text(strip=True) if soup.find('h1') else "Unknown Product"
-    
-    container = soup.find('table', class_='wide discounts_table')
-    if not container:
-        return {"name": product_name, "discounts": []}
-    
-    discounts = []
-    rows = container.find_all('tr', class_='discount_row')
-    
-    for row in rows:
-        shop_name_elem = row.find('span', class_='discounts_shop_name')
-        shop_name = shop_name_elem.find('span').get_text(strip=True) if shop_name_elem else "N/A"
-        
-        price_elem = row.find('strong', class_='discount_price_value')
-        price = price_elem.get_text(strip=True) if price_elem else "N/A"
-        
-        amount_elem = row.find('div', class_='discount_amount')
-        amount = amount_elem.get_text(strip=True).replace('/', '').strip() if amount_elem else "N/A"
-        
-        # Calculate price per gram
-        price_value = parse_price(price)
-        amount_value = parse_amount(amount)
-        price_per_gram = price_value / amount_value if amount_value > 0 else 0
-        
-        validity_elem = row.find('td', class_='discounts_validity')
-        validity_span = validity_elem.find('span') if validity_elem else None
-        expiration = validity_span.get_text(strip=True) if validity_span else "N/A"
-        
-        markets_elem = row.find('div', class_='discounts_markets')
-        markets_link = markets_elem.find('a') if markets_elem else None
-        shops_valid = markets_link.get_text(strip=True) if markets_link else "N/A"
-        
-        note_elem = row.find('div', class_='discount_note')
-        note = note_elem.get_text(strip=True) if note_elem else ""
-        
-        discounts.append({
-            "shop_name": shop_name,
-            "price": price,
-            "amount": amount,
-            "price_per_gram": price_per_gram,
-            "expiration": expiration,
-            "shops_valid": shops_valid,
-            "additional_note": note
-        })
-    
-    return {"name": product_name, "discounts": discounts}
+    Region and note are left out because sources word them differently; that is
+    also why the key only compares rows of different pages, not rows of one page.
+    Takes parsed discounts and stored price_history rows (numeric price) alike.
+    """
+    price = discount['price']
+    if isinstance(price, str):
+        price = parse_price(price)
+    return (discount['shop_name'], price, discount['amount'], discount['expiration'])
 
-def save_to_database(conn, url: str, product_data: Dict):
+def dedupe_discounts(discounts: List[Dict], seen: Optional[Set[Tuple]] = None) -> List[Dict]:
+    """Drop offers already saved from another page (their offer_key is in seen).
+
+    Rows of one page are all kept: they may differ only by shops_valid or
+    additional_note, e.g. the same price in two regions.
+    """
+    if not seen:
+        return discounts
+    return [discount for discount in discounts if offer_key(discount) not in seen]
+
+def discover_urls(source: Source) -> List[str]:
+    try:
+        return source.discover()
+    except Exception as e:
+        logger.error(f"Error listing products from {source.name}: {str(e)}")
+        return list(source.product_urls)
+
+def save_to_database(repo: Repository, url: str, product_data: Dict,
+                     timestamp: Optional[str] = None) -> int:
     """Save scraped data to database"""
-    c = conn.cursor()
+    return repo.save_product_data(url, product_data, timestamp or datetime.now().isoformat())
+
+def save_page(repo: Repository, names: NameIndex, saved_offers: Dict[int, Set[Tuple]], page_id: int,
+              url: str, product_data: Dict, timestamp: str) -> int:
+    """Match, dedupe and save one parsed page, then mark its archive entry parsed.
+
+    Shared by scrape runs and archive.py's reparse. saved_offers maps product
+    ids to the offer_keys stored at timestamp; a product not in it yet is
+    loaded from price_history, so offers another page of the same run already
+    saved are skipped. Returns the product id.
+    """
+    # Counted before cross-source dedupe: a page whose offers were all
+    # saved from another URL parsed fine and needs no replay
+    parsed = len(product_data['discounts'])
+    resolve_product_url(repo, names, url, product_data['name'])
+    product_id = repo.product_id_for_url(url)
+    if product_id is not None and product_id not in saved_offers:
+        saved_offers[product_id] = {offer_key(row) for row in repo.history_at(product_id, timestamp)}
+    product_data['discounts'] = dedupe_discounts(product_data['discounts'], saved_offers.get(product_id))
+    product_id = save_to_database(repo, url, product_data, timestamp)
+    saved_offers.setdefault(product_id, set()).update(
+        offer_key(discount) for discount in product_data['discounts'])
+    repo.update_archived_page(page_id, parsed)
+    if product_id not in names.shingles:
+        names.add(product_id, product_data['name'])
+    return product_id
+
+def fetch_and_parse(source: Source, url: str) -> Tuple[str, Optional[Dict]]:
+    """Fetch and archive a page, then parse it.
+
+    Returns the archive hash and the parsed data (None if parsing failed; the
+    page stays archived so it can be reparsed once the parser is fixed).
+    """
+    html = source.fetch(url)
+    sha256 = store_page(html)
+    try:
+        return sha256, source.parse_product(html, url)
+    except Exception as e:
+        logger.error(f"Error parsing {url}: {str(e)}")
+        return sha256, None
+
+def scrape_all_products(sources: Optional[List[Source]] = None):
+    """Function to scrape all products - this is what app.py expects"""
+    logger.info("Starting to scrape all products...")
+    if sources is None:
+        sources = [source_class() for source_class in SOURCES]
     
-    # Insert or update product
-    c.execute('''
-        INSERT OR IGNORE INTO products (url, name)
-        VALUES (?, ?)
-    ''', (url, product_data['name']))
+    repo = get_repository()
+    repo.setup()
     
-    c.execute('SELECT id FROM products WHERE url = ?', (url,))
-    product_id = c.fetchone()[0]
+    # Known product names, so the same item under a new URL joins its history
+    names = NameIndex.from_repository(repo)
     
-    # Insert price history
+    # One timestamp for the whole run: readers take each product's rows at its
+    # MAX(fetch_timestamp), so all URLs of a product must share it
     timestamp = datetime.now().isoformat()
-    for discount in product_data['discounts']:
-        c.execute('''
-            INSERT INTO price_history 
-            (product_id, shop_name, price, amount, price_per_gram, expiration, 
-             shops_valid, additional_note, fetch_timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            product_id,
-            discount['shop_name'],
-            parse_price(discount['price']),
-            discount['amount'],
-            discount['price_per_gram'],
-            discount['expiration'],
-            discount['shops_valid'],
-            discount['additional_note'],
-            timestamp
-        ))
-    
-    conn.commit()
-
-def scrape_all_products():
-    """Function to scrape all products - this is what app.py expects"""
-    logger.info("Starting to scrape all products...")
-    urls = [
-        'https://www.kupi.cz/sleva/tunak-v-oleji-rio-mare',
-        'https://www.kupi.cz/sleva/cokolada-studentska-pecet-orion',
-        'https://www.kupi.cz/sleva/zlate-polomacene-opavia',
-        'https://www.kupi.cz/sleva/cokopiskoty-figaro'
-    ]
     
-    conn = setup_database()
+    # Offers saved this run per product id: several sources (aggregators) may
+    # list the same offer under different URLs of one product
+    saved_offers = {}
     
-    for url in urls:
-        try:
-            logger.info(f"Scraping {url}...")
-            product_data = scrape_product(url)
-            save_to_database(conn, url, product_data)
-            logger.info(f"Successfully processed: {product_data['name']}")
-        except Exception as e:
-            logger.error(f"Error processing {url}: {str(e)}")
+    # Pages are fetched concurrently; sources.rate_limiter keeps each host polite
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # A URL found by several sources is scraped once, by the first of them
+        jobs = {}
+        for source, urls in zip(sources, pool.map(discover_urls, sources)):
+            for url in urls:
+                jobs.setdefault(url, source)
+        
+        futures = {pool.submit(fetch_and_parse, source, url): (source, url)
+                   for url, source in jobs.items()}
+        for future in as_completed(futures):
+            source, url = futures[future]
+            try:
+                sha256, product_data = future.result()
+                # Catalog the fetch as saving nothing first: if parsing or saving
+                # fails, archive.py can still replay it later
+                page_id = repo.record_archived_page(url, source.name, sha256, timestamp, 0)
+                if product_data is not None:
+                    save_page(repo, names, saved_offers, page_id, url, product_data, timestamp)
+                    logger.info(f"Successfully processed: {product_data['name']} ({source.name})")
+            except Exception as e:
+                logger.error(f"Error processing {url}: {str(e)}")
     
-    conn.close()
     logger.info("Scraping completed!")
 
 if __name__ == '__main__':
@@ -0,0 +1,150 @@
+# sources.py
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from units import parse_price, price_per_unit
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+# Minimum seconds between two requests to the same host, across all sources
+REQUEST_INTERVAL = 1.0
+REQUEST_TIMEOUT = 30
+
+class RateLimiter:
+    """Spaces out requests per host; shared by every source and worker thread"""
+
+    def __init__(self, interval: float = REQUEST_INTERVAL):
+        self.interval = interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+rate_limiter = RateLimiter()
+
+class Source(ABC):
+    """A site prices are scraped from.
+
+    Subclasses set name, list the pages to start from and parse the markup;
+    fetching and rate limiting are shared. parse_product returns the same
+    {"name", "discounts"} dict that the repository stores.
+    """
+
+    name = ''
+    # Product pages tracked directly
+    product_urls: List[str] = []
+    # Listing/category pages whose product links are followed
+    listing_urls: List[str] = []
+
+    def fetch(self, url: str) -> bytes:
+        rate_limiter.wait(url)
+        response = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+
+    @abstractmethod
+    def parse_listing(self, html: bytes, url: str) -> List[str]:
+        """Product page URLs linked from a listing page"""
+
+    @abstractmethod
+    def parse_product(self, html: bytes, url: str) -> Dict:
+        """The product's name and discounts parsed from its page"""
+
+    def scrape_product(self, url: str) -> Dict:
+        return self.parse_product(self.fetch(url), url)
+
+    def discover(self) -> List[str]:
+        """Tracked product URLs plus everything found on the listing pages"""
+        urls = list(self.product_urls)
+        for listing_url in self.listing_urls:
+            urls.extend(self.parse_listing(self.fetch(listing_url), listing_url))
+        return list(dict.fromkeys(urls))
+
+class KupiSource(Source):
+    """kupi.cz product pages ("sleva") with their discounts table"""
+
+    name = 'kupi.cz'
+    product_urls = [
+        'https://www.kupi.cz/sleva/tunak-v-oleji-rio-mare',
+        'https://www.kupi.cz/sleva/cokolada-studentska-pecet-orion',
+        'https://www.kupi.cz/sleva/zlate-polomacene-opavia',
+        'https://www.kupi.cz/sleva/cokopiskoty-figaro'
+    ]
+
+    def parse_listing(self, html: bytes, url: str) -> List[str]:
+        soup = BeautifulSoup(html, 'html.parser')
+        links = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)
+                 if '/sleva/' in a['href']]
+        return list(dict.fromkeys(links))
+
+    def parse_product(self, html: bytes, url: str) -> Dict:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Get product name
+        product_name = soup.find('h1').get_text(strip=True) if soup.find('h1') else "Unknown Product"
+
+        container = soup.find('table', class_='wide discounts_table')
+        if not container:
+            return {"name": product_name, "discounts": []}
+
+        discounts = []
+        rows = container.find_all('tr', class_='discount_row')
+
+        for row in rows:
+            shop_name_elem = row.find('span', class_='discounts_shop_name')
+            shop_name = shop_name_elem.find('span').get_text(strip=True) if shop_name_elem else "N/A"
+
+            price_elem = row.find('strong', class_='discount_price_value')
+            price = price_elem.get_text(strip=True) if price_elem else "N/A"
+
+            amount_elem = row.find('div', class_='discount_amount')
+            amount = amount_elem.get_text(strip=True).replace('/', '').strip() if amount_elem else "N/A"
+
+            # Calculate price per base unit (gram, millilitre or piece)
+            price_per_gram, unit = price_per_unit(parse_price(price), amount)
+
+            validity_elem = row.find('td', class_='discounts_validity')
+            validity_span = validity_elem.find('span') if validity_elem else None
+            expiration = validity_span.get_text(strip=True) if validity_span else "N/A"
+
+            markets_elem = row.find('div', class_='discounts_markets')
+            markets_link = markets_elem.find('a') if markets_elem else None
+            shops_valid = markets_link.get_text(strip=True) if markets_link else "N/A"
+
+            note_elem = row.find('div', class_='discount_note')
+            note = note_elem.get_text(strip=True) if note_elem else ""
+
+            discounts.append({
+                "shop_name": shop_name,
+                "price": price,
+                "amount": amount,
+                "price_per_gram": price_per_gram,
+                "unit": unit,
+                "expiration": expiration,
+                "shops_valid": shops_valid,
+                "additional_note": note
+            })
+
+        return {"name": product_name, "discounts": discounts}
+
+# Every source scraped by scrape_all_products; add new adapters here
+SOURCES = [KupiSource]
+
+def get_source(name: str) -> Source:
+    for source_class in SOURCES:
+        if source_class.name == name:
+            return source_class()
+    raise KeyError(f"Unknown source: {name}")
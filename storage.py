@@ -0,0 +1,553 @@
+# storage.py
+import os
+import sqlite3
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import queries
+from units import parse_price
+
+logger = logging.getLogger(__name__)
+
+# price_history columns returned by the row-level (id based) reads
+HISTORY_FIELDS = ('id', 'product_id', 'shop_name', 'price', 'amount', 'price_per_gram', 'expiration',
+                  'shops_valid', 'additional_note', 'fetch_timestamp', 'unit')
+
+# Resolve the default database next to the code, not the working directory
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_tracker.db')
+
+class Repository(ABC):
+    """Storage interface used by the web app and the scraper.
+
+    Backends return plain dicts/lists so callers never see driver-specific
+    rows. Every method manages its own connection.
+    """
+
+    @abstractmethod
+    def setup(self):
+        """Create tables and indexes, applying in-place migrations"""
+
+    @abstractmethod
+    def list_products(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_product(self, product_id: int) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def latest_deals(self, product_id: int, limit: int = 3) -> List[Dict]:
+        """Cheapest deals (by price per unit) from the product's latest scrape"""
+
+    @abstractmethod
+    def product_shops(self, product_id: int) -> List[str]:
+        ...
+
+    @abstractmethod
+    def daily_lowest_prices(self, product_id: int, start: Optional[str] = None,
+                            end: Optional[str] = None, shop: Optional[str] = None,
+                            per_shop: bool = False) -> List[Dict]:
+        """Lowest price per day (and per shop if per_shop) as date/price/shops dicts"""
+
+    @abstractmethod
+    def save_product_data(self, url: str, product_data: Dict, timestamp: str) -> int:
+        """Upsert the product and bulk insert its discounts, returning the product id"""
+
+    @abstractmethod
+    def basket_cost_by_shop(self, product_ids: List[int]) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def cheapest_deals(self, name_query: Optional[str] = None, unit: str = 'g',
+                       since: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def shop_leaderboard(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def distinct_amounts(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def apply_unit_updates(self, updates: List[Tuple[str, float, str]], dry_run: bool = False) -> int:
+        """Set price_per_gram/unit for all rows of each (amount, quantity, unit).
+
+        Returns the number of rows that changed.
+        """
+
+    @abstractmethod
+    def products_by_ids(self, product_ids: List[int]) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def product_id_for_url(self, url: str) -> Optional[int]:
+        """Product a URL belongs to, through products.url or an alias"""
+
+    @abstractmethod
+    def add_product_alias(self, url: str, product_id: int):
+        """Record that url is another page of an existing product"""
+
+    @abstractmethod
+    def merge_products(self, target_id: int, duplicate_ids: List[int]) -> int:
+        """Move history and URLs of duplicate_ids onto target_id and delete them.
+
+        Returns the number of price_history rows re-linked.
+        """
+
+    @abstractmethod
+    def data_generation(self) -> int:
+        """Counter bumped whenever rows are rewritten or deleted in place.
+
+        Merges and unit updates change existing rows, which readers tracking
+        only new ids (the price index) cannot see; they rebuild when it moves.
+        """
+
+    @abstractmethod
+    def record_archived_page(self, url: str, source: str, sha256: str,
+                             fetched_at: str, rows_saved: int) -> int:
+        """Catalog an archived page fetch, returning its id"""
+
+    @abstractmethod
+    def archived_pages(self, since: Optional[str] = None, until: Optional[str] = None,
+                       only_empty: bool = True) -> List[Dict]:
+        """Archived fetches in time order, by default only those that saved no rows"""
+
+    @abstractmethod
+    def update_archived_page(self, page_id: int, rows_saved: int):
+        ...
+
+    @abstractmethod
+    def max_history_id(self) -> int:
+        """Highest price_history id, 0 for an empty table"""
+
+    @abstractmethod
+    def history_since(self, after_id: int, limit: int = 1000) -> List[Dict]:
+        """price_history rows with id > after_id, in id order.
+
+        Backends must make ids visible in commit order, so that a reader that
+        has seen id N never later finds a new row below N.
+        """
+
+    @abstractmethod
+    def latest_history(self, up_to_id: int) -> List[Dict]:
+        """Every product's latest snapshot rows, ignoring rows after up_to_id"""
+
+    @abstractmethod
+    def history_at(self, product_id: int, fetch_timestamp: str) -> List[Dict]:
+        """The product's price_history rows stamped fetch_timestamp (one scrape run)"""
+
+    def close(self):
+        pass
+
+class SQLiteRepository(Repository):
+    """Default backend: one SQLite file, a short-lived connection per call"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+
+    @contextmanager
+    def connection(self):
+        # Wait for other writers instead of failing with "database is locked"
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def setup(self):
+        with self.connection() as conn:
+            c = conn.cursor()
+            # WAL lets the web app read while the scraper writes
+            c.execute('PRAGMA journal_mode=WAL')
+
+            # Create products table
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT UNIQUE,
+                    name TEXT,
+                    search_name TEXT
+                )
+            ''')
+
+            # Create price_history table
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS price_history (
+                    id INTEGER PRIMARY KEY,
+                    product_id INTEGER,
+                    shop_name TEXT,
+                    price REAL,
+                    amount TEXT,
+                    price_per_gram REAL,
+                    expiration TEXT,
+                    shops_valid TEXT,
+                    additional_note TEXT,
+                    fetch_timestamp DATETIME,
+                    unit TEXT,
+                    FOREIGN KEY (product_id) REFERENCES products (id)
+                )
+            ''')
+
+            # Further URLs of a product, found by fuzzy name matching
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS product_aliases (
+                    url TEXT PRIMARY KEY,
+                    product_id INTEGER,
+                    FOREIGN KEY (product_id) REFERENCES products (id)
+                )
+            ''')
+
+            # Raw pages kept in the HTML archive, for reparsing
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS page_archive (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT,
+                    source TEXT,
+                    sha256 TEXT,
+                    fetched_at DATETIME,
+                    rows_saved INTEGER
+                )
+            ''')
+
+            # Single-row counter behind data_generation()
+            c.execute('CREATE TABLE IF NOT EXISTS data_generation (generation INTEGER NOT NULL)')
+            c.execute('''
+                INSERT INTO data_generation (generation)
+                SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM data_generation)
+            ''')
+
+            # Databases created before per-unit prices lack the unit column
+            c.execute('PRAGMA table_info(price_history)')
+            if 'unit' not in [column[1] for column in c.fetchall()]:
+                c.execute('ALTER TABLE price_history ADD COLUMN unit TEXT')
+
+            # Databases created before folded name search lack search_name
+            c.execute('PRAGMA table_info(products)')
+            if 'search_name' not in [column[1] for column in c.fetchall()]:
+                c.execute('ALTER TABLE products ADD COLUMN search_name TEXT')
+            c.execute('SELECT id, name FROM products WHERE search_name IS NULL')
+            c.executemany('UPDATE products SET search_name = ? WHERE id = ?',
+                          [(queries.fold_name(name or ''), product_id) for product_id, name in c.fetchall()])
+
+            conn.commit()
+            queries.create_indexes(conn)
+
+    def list_products(self) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute('SELECT id, name, url FROM products').fetchall()
+        return [{'id': row[0], 'name': row[1], 'url': row[2]} for row in rows]
+
+    def get_product(self, product_id: int) -> Optional[Dict]:
+        with self.connection() as conn:
+            row = conn.execute('SELECT id, name, url FROM products WHERE id = ?',
+                               (product_id,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'name': row[1], 'url': row[2]}
+
+    def latest_deals(self, product_id: int, limit: int = 3) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT shop_name, price, amount, price_per_gram, expiration, shops_valid,
+                        additional_note, fetch_timestamp, COALESCE(unit, 'g')
+                FROM price_history
+                WHERE product_id = ? AND fetch_timestamp = (
+                    SELECT MAX(fetch_timestamp) FROM price_history WHERE product_id = ?
+                )
+                ORDER BY price_per_gram ASC
+                LIMIT ?
+            ''', (product_id, product_id, limit)).fetchall()
+
+        return [{
+            'shop_name': row[0],
+            'price': row[1],
+            'amount': row[2],
+            'price_per_gram': row[3],
+            'expiration': row[4],
+            'shops_valid': row[5],
+            'additional_note': row[6],
+            'fetch_timestamp': row[7],
+            'unit': row[8]
+        } for row in rows]
+
+    def product_shops(self, product_id: int) -> List[str]:
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT DISTINCT shop_name FROM price_history WHERE product_id = ? ORDER BY shop_name
+            ''', (product_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def daily_lowest_prices(self, product_id: int, start: Optional[str] = None,
+                            end: Optional[str] = None, shop: Optional[str] = None,
+                            per_shop: bool = False) -> List[Dict]:
+        where = ['product_id = ?']
+        params = [product_id]
+        if start:
+            where.append('fetch_timestamp >= ?')
+            params.append(start)
+        if end:
+            where.append("fetch_timestamp < date(?, '+1 day')")
+            params.append(end)
+        if shop:
+            where.append('shop_name = ?')
+            params.append(shop)
+
+        # SQLite fills the bare shop_name column from the row holding MIN(price)
+        group_by = 'date(fetch_timestamp), shop_name' if per_shop else 'date(fetch_timestamp)'
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT
+                    date(fetch_timestamp) as date,
+                    MIN(price) as lowest_price,
+                    shop_name
+                FROM price_history
+                WHERE {' AND '.join(where)}
+                GROUP BY {group_by}
+                ORDER BY date
+            ''', params).fetchall()
+
+        return [{'date': row[0], 'price': row[1], 'shops': row[2]} for row in rows]
+
+    def save_product_data(self, url: str, product_data: Dict, timestamp: str) -> int:
+        with self.connection() as conn:
+            c = conn.cursor()
+
+            c.execute('SELECT product_id FROM product_aliases WHERE url = ?', (url,))
+            alias = c.fetchone()
+            if alias:
+                product_id = alias[0]
+            else:
+                # Insert or update product
+                c.execute('''
+                    INSERT OR IGNORE INTO products (url, name, search_name)
+                    VALUES (?, ?, ?)
+                ''', (url, product_data['name'], queries.fold_name(product_data['name'])))
+
+                c.execute('SELECT id FROM products WHERE url = ?', (url,))
+                product_id = c.fetchone()[0]
+
+            # Insert price history
+            c.executemany('''
+                INSERT INTO price_history
+                (product_id, shop_name, price, amount, price_per_gram, expiration,
+                 shops_valid, additional_note, fetch_timestamp, unit)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [history_row(product_id, discount, timestamp)
+                  for discount in product_data['discounts']])
+        return product_id
+
+    def basket_cost_by_shop(self, product_ids: List[int]) -> List[Dict]:
+        with self.connection() as conn:
+            return queries.basket_cost_by_shop(conn, product_ids)
+
+    def cheapest_deals(self, name_query: Optional[str] = None, unit: str = 'g',
+                       since: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        with self.connection() as conn:
+            return queries.cheapest_deals(conn, name_query=name_query, unit=unit,
+                                          since=since, limit=limit)
+
+    def shop_leaderboard(self) -> List[Dict]:
+        with self.connection() as conn:
+            return queries.shop_leaderboard(conn)
+
+    def distinct_amounts(self) -> List[str]:
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute('SELECT DISTINCT amount FROM price_history')]
+
+    def apply_unit_updates(self, updates: List[Tuple[str, float, str]], dry_run: bool = False) -> int:
+        with self.connection() as conn:
+            # Load the updates into a temp table (dropped with the connection) and
+            # apply them in one pass over price_history instead of one per amount
+            conn.execute('CREATE TEMP TABLE unit_updates (amount TEXT PRIMARY KEY, quantity REAL, unit TEXT)')
+            conn.executemany('INSERT OR REPLACE INTO unit_updates (amount, quantity, unit) VALUES (?, ?, ?)',
+                             updates)
+            changed = conn.execute('''
+                UPDATE price_history
+                SET price_per_gram = CASE WHEN u.quantity > 0 THEN price / u.quantity ELSE 0 END,
+                    unit = u.unit
+                FROM unit_updates u
+                WHERE price_history.amount IS u.amount
+                  AND (price_history.unit IS NOT u.unit
+                       OR price_per_gram IS NOT CASE WHEN u.quantity > 0 THEN price / u.quantity ELSE 0 END)
+            ''').rowcount
+            if dry_run:
+                conn.rollback()
+            elif changed:
+                bump_generation(conn)
+        return changed
+
+    def products_by_ids(self, product_ids: List[int]) -> List[Dict]:
+        if not product_ids:
+            return []
+        placeholders = ', '.join('?' for _ in product_ids)
+        with self.connection() as conn:
+            rows = conn.execute(f'SELECT id, name, url FROM products WHERE id IN ({placeholders}) ORDER BY id',
+                                list(product_ids)).fetchall()
+        return [{'id': row[0], 'name': row[1], 'url': row[2]} for row in rows]
+
+    def product_id_for_url(self, url: str) -> Optional[int]:
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT id FROM products WHERE url = :url
+                UNION ALL
+                SELECT product_id FROM product_aliases WHERE url = :url
+            ''', {'url': url}).fetchone()
+        return row[0] if row else None
+
+    def add_product_alias(self, url: str, product_id: int):
+        with self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO product_aliases (url, product_id) VALUES (?, ?)',
+                         (url, product_id))
+
+    def merge_products(self, target_id: int, duplicate_ids: List[int]) -> int:
+        duplicate_ids = [product_id for product_id in duplicate_ids if product_id != target_id]
+        if not duplicate_ids:
+            return 0
+        placeholders = ', '.join('?' for _ in duplicate_ids)
+        with self.connection() as conn:
+            c = conn.cursor()
+            c.execute(f'''
+                UPDATE price_history SET product_id = ? WHERE product_id IN ({placeholders})
+            ''', [target_id] + duplicate_ids)
+            relinked = c.rowcount
+            c.execute(f'''
+                INSERT OR REPLACE INTO product_aliases (url, product_id)
+                SELECT url, ? FROM products WHERE id IN ({placeholders})
+            ''', [target_id] + duplicate_ids)
+            c.execute(f'''
+                UPDATE product_aliases SET product_id = ? WHERE product_id IN ({placeholders})
+            ''', [target_id] + duplicate_ids)
+            c.execute(f'DELETE FROM products WHERE id IN ({placeholders})', duplicate_ids)
+            bump_generation(conn)
+        return relinked
+
+    def data_generation(self) -> int:
+        with self.connection() as conn:
+            row = conn.execute('SELECT MAX(generation) FROM data_generation').fetchone()
+        return row[0] or 0
+
+    def record_archived_page(self, url: str, source: str, sha256: str,
+                             fetched_at: str, rows_saved: int) -> int:
+        with self.connection() as conn:
+            c = conn.execute('''
+                INSERT INTO page_archive (url, source, sha256, fetched_at, rows_saved)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (url, source, sha256, fetched_at, rows_saved))
+            return c.lastrowid
+
+    def archived_pages(self, since: Optional[str] = None, until: Optional[str] = None,
+                       only_empty: bool = True) -> List[Dict]:
+        where = ['1 = 1']
+        params = []
+        if only_empty:
+            where.append('rows_saved = 0')
+        if since:
+            where.append('fetched_at >= ?')
+            params.append(since)
+        if until:
+            where.append("fetched_at < date(?, '+1 day')")
+            params.append(until)
+        fields = ('id', 'url', 'source', 'sha256', 'fetched_at', 'rows_saved')
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(fields)} FROM page_archive
+                WHERE {' AND '.join(where)}
+                ORDER BY fetched_at
+            ''', params).fetchall()
+        return [dict(zip(fields, row)) for row in rows]
+
+    def update_archived_page(self, page_id: int, rows_saved: int):
+        with self.connection() as conn:
+            conn.execute('UPDATE page_archive SET rows_saved = ? WHERE id = ?', (rows_saved, page_id))
+
+    def max_history_id(self) -> int:
+        with self.connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM price_history').fetchone()[0]
+
+    def history_since(self, after_id: int, limit: int = 1000) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(HISTORY_FIELDS)}
+                FROM price_history
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (after_id, limit)).fetchall()
+        return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+    def latest_history(self, up_to_id: int) -> List[Dict]:
+        columns = ', '.join(f'ph.{field}' for field in HISTORY_FIELDS)
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {columns}
+                FROM products p
+                CROSS JOIN price_history ph
+                  ON ph.product_id = p.id
+                 AND ph.fetch_timestamp = (
+                     SELECT MAX(fetch_timestamp) FROM price_history
+                     WHERE product_id = p.id AND id <= :up_to_id
+                 )
+                WHERE ph.id <= :up_to_id
+                ORDER BY ph.id
+            ''', {'up_to_id': up_to_id}).fetchall()
+        return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+    def history_at(self, product_id: int, fetch_timestamp: str) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(HISTORY_FIELDS)}
+                FROM price_history
+                WHERE product_id = ? AND fetch_timestamp = ?
+                ORDER BY id
+            ''', (product_id, fetch_timestamp)).fetchall()
+        return [dict(zip(HISTORY_FIELDS, row)) for row in rows]
+
+def bump_generation(conn):
+    """Advance data_generation() inside the transaction that rewrote rows"""
+    conn.execute('UPDATE data_generation SET generation = generation + 1')
+
+def history_row(product_id: int, discount: Dict, timestamp: str) -> Tuple:
+    """Column values for one price_history row, in insert order"""
+    return (
+        product_id,
+        discount['shop_name'],
+        parse_price(discount['price']),
+        discount['amount'],
+        discount['price_per_gram'],
+        discount['expiration'],
+        discount['shops_valid'],
+        discount['additional_note'],
+        timestamp,
+        discount['unit']
+    )
+
+_repository = None
+
+def get_repository() -> Repository:
+    """Shared repository chosen by DATABASE_URL.
+
+    postgresql://... selects the PostgreSQL backend; a path or sqlite:///path
+    selects SQLite; unset uses price_tracker.db next to the code.
+    """
+    global _repository
+    if _repository is None:
+        _repository = create_repository(os.environ.get('DATABASE_URL'))
+    return _repository
+
+def create_repository(database_url: Optional[str] = None) -> Repository:
+    if not database_url:
+        return SQLiteRepository()
+    if database_url.startswith(('postgresql://', 'postgres://')):
+        from storage_postgres import PostgresRepository
+        return PostgresRepository(database_url)
+    if database_url.startswith('sqlite:///'):
+        database_url = database_url[len('sqlite:///'):]
+    return SQLiteRepository(database_url)
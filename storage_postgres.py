@@ -0,0 +1,417 @@
+# storage_postgres.py
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from queries import fold_name, summarize_basket
+from storage import HISTORY_FIELDS, Repository, bump_generation, history_row
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock taken by every price_history insert, see save_product_data
+INGEST_LOCK = 7380001
+
+HISTORY_COLUMNS = ('product_id', 'shop_name', 'price', 'amount', 'price_per_gram', 'expiration',
+                   'shops_valid', 'additional_note', 'fetch_timestamp', 'unit')
+
+# Same latest-snapshot shape as queries.LATEST_DEALS, timestamps rendered as ISO text
+LATEST_DEALS = '''
+    SELECT ph.product_id, p.name AS product_name, p.search_name, ph.shop_name, ph.price,
+           ph.price_per_gram, COALESCE(ph.unit, 'g') AS unit, ph.fetch_timestamp
+    FROM products p
+    JOIN price_history ph
+      ON ph.product_id = p.id
+     AND ph.fetch_timestamp = (
+         SELECT MAX(fetch_timestamp) FROM price_history WHERE product_id = p.id
+     )
+'''
+
+class PostgresRepository(Repository):
+    """PostgreSQL backend with a connection pool, COPY ingest and native upserts"""
+
+    def __init__(self, database_url: str, min_size: int = 1, max_size: int = 10):
+        self.pool = ConnectionPool(database_url, min_size=min_size, max_size=max_size,
+                                   kwargs={'row_factory': dict_row}, open=True)
+
+    @contextmanager
+    def connection(self):
+        # The pool commits on success and rolls back on error
+        with self.pool.connection() as conn:
+            yield conn
+
+    def setup(self):
+        with self.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS products (
+                    id BIGSERIAL PRIMARY KEY,
+                    url TEXT UNIQUE,
+                    name TEXT,
+                    search_name TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS price_history (
+                    id BIGSERIAL PRIMARY KEY,
+                    product_id BIGINT REFERENCES products (id),
+                    shop_name TEXT,
+                    price DOUBLE PRECISION,
+                    amount TEXT,
+                    price_per_gram DOUBLE PRECISION,
+                    expiration TEXT,
+                    shops_valid TEXT,
+                    additional_note TEXT,
+                    fetch_timestamp TIMESTAMP,
+                    unit TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS product_aliases (
+                    url TEXT PRIMARY KEY,
+                    product_id BIGINT REFERENCES products (id)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS page_archive (
+                    id BIGSERIAL PRIMARY KEY,
+                    url TEXT,
+                    source TEXT,
+                    sha256 TEXT,
+                    fetched_at TIMESTAMP,
+                    rows_saved INTEGER
+                )
+            ''')
+            # Databases created before folded name search lack search_name
+            conn.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS search_name TEXT')
+            rows = conn.execute('SELECT id, name FROM products WHERE search_name IS NULL').fetchall()
+            with conn.cursor() as cursor:
+                cursor.executemany('UPDATE products SET search_name = %s WHERE id = %s',
+                                   [(fold_name(row['name'] or ''), row['id']) for row in rows])
+            conn.execute('CREATE TABLE IF NOT EXISTS data_generation (generation BIGINT NOT NULL)')
+            conn.execute('''
+                INSERT INTO data_generation (generation)
+                SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM data_generation)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_price_history_latest
+                ON price_history (product_id, fetch_timestamp)
+                INCLUDE (shop_name, price, price_per_gram, unit)
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_price_history_shop
+                ON price_history (shop_name, product_id, fetch_timestamp)
+            ''')
+
+    def list_products(self) -> List[Dict]:
+        with self.connection() as conn:
+            return conn.execute('SELECT id, name, url FROM products ORDER BY id').fetchall()
+
+    def get_product(self, product_id: int) -> Optional[Dict]:
+        with self.connection() as conn:
+            return conn.execute('SELECT id, name, url FROM products WHERE id = %s',
+                                (product_id,)).fetchone()
+
+    def latest_deals(self, product_id: int, limit: int = 3) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT shop_name, price, amount, price_per_gram, expiration, shops_valid,
+                       additional_note, fetch_timestamp, COALESCE(unit, 'g') AS unit
+                FROM price_history
+                WHERE product_id = %(id)s AND fetch_timestamp = (
+                    SELECT MAX(fetch_timestamp) FROM price_history WHERE product_id = %(id)s
+                )
+                ORDER BY price_per_gram ASC
+                LIMIT %(limit)s
+            ''', {'id': product_id, 'limit': limit}).fetchall()
+        return [_iso_timestamp(row) for row in rows]
+
+    def product_shops(self, product_id: int) -> List[str]:
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT DISTINCT shop_name FROM price_history WHERE product_id = %s ORDER BY shop_name
+            ''', (product_id,)).fetchall()
+        return [row['shop_name'] for row in rows]
+
+    def daily_lowest_prices(self, product_id: int, start: Optional[str] = None,
+                            end: Optional[str] = None, shop: Optional[str] = None,
+                            per_shop: bool = False) -> List[Dict]:
+        where = ['product_id = %(id)s']
+        params = {'id': product_id, 'start': start, 'end': end, 'shop': shop}
+        if start:
+            where.append('fetch_timestamp >= %(start)s::date')
+        if end:
+            where.append("fetch_timestamp < %(end)s::date + 1")
+        if shop:
+            where.append('shop_name = %(shop)s')
+
+        # DISTINCT ON keeps the cheapest row of each group, shop name included
+        group_by = 'fetch_timestamp::date, shop_name' if per_shop else 'fetch_timestamp::date'
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT DISTINCT ON ({group_by})
+                    fetch_timestamp::date::text AS date,
+                    price,
+                    shop_name AS shops
+                FROM price_history
+                WHERE {' AND '.join(where)}
+                ORDER BY {group_by}, price ASC
+            ''', params).fetchall()
+        return rows
+
+    def save_product_data(self, url: str, product_data: Dict, timestamp: str) -> int:
+        with self.connection() as conn:
+            alias = conn.execute('SELECT product_id FROM product_aliases WHERE url = %s',
+                                 (url,)).fetchone()
+            if alias:
+                product_id = alias['product_id']
+            else:
+                # Touch the row on conflict so RETURNING yields the existing id;
+                # like the SQLite backend, the first seen name is kept
+                product_id = conn.execute('''
+                    INSERT INTO products (url, name, search_name)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (url) DO UPDATE SET url = EXCLUDED.url
+                    RETURNING id
+                ''', (url, product_data['name'], fold_name(product_data['name']))).fetchone()['id']
+
+            # BIGSERIAL ids are assigned at insert time, not commit time: two
+            # concurrent writers could commit a lower id after a higher one is
+            # visible, and readers following the id cursor (history_since,
+            # the change feed, the price index) would skip it for good. Holding
+            # this lock until commit keeps ids in commit order.
+            conn.execute('SELECT pg_advisory_xact_lock(%s)', (INGEST_LOCK,))
+            with conn.cursor().copy(
+                f"COPY price_history ({', '.join(HISTORY_COLUMNS)}) FROM STDIN"
+            ) as copy:
+                for discount in product_data['discounts']:
+                    copy.write_row(history_row(product_id, discount, timestamp))
+        return product_id
+
+    def basket_cost_by_shop(self, product_ids: List[int]) -> List[Dict]:
+        if not product_ids:
+            return []
+        product_ids = sorted(set(product_ids))
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                WITH latest AS ({LATEST_DEALS} WHERE p.id = ANY(%s)),
+                best AS (
+                    SELECT shop_name, product_id, MIN(price) AS price
+                    FROM latest
+                    GROUP BY shop_name, product_id
+                )
+                SELECT shop_name, SUM(price) AS total, string_agg(product_id::text, ',') AS covered
+                FROM best
+                GROUP BY shop_name
+            ''', (product_ids,)).fetchall()
+        return summarize_basket([(row['shop_name'], row['total'], row['covered']) for row in rows],
+                                product_ids)
+
+    def cheapest_deals(self, name_query: Optional[str] = None, unit: str = 'g',
+                       since: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        where = ['unit = %(unit)s', 'price_per_gram > 0']
+        params = {'unit': unit, 'limit': limit}
+        if name_query:
+            # Same folded comparison as the SQLite backend, not ILIKE
+            where.append('search_name LIKE %(name)s')
+            params['name'] = f'%{fold_name(name_query)}%'
+        if since:
+            where.append('fetch_timestamp >= %(since)s::timestamp')
+            params['since'] = since
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT product_id, product_name, shop_name, price, price_per_gram, unit, fetch_timestamp
+                FROM ({LATEST_DEALS}) latest
+                WHERE {' AND '.join(where)}
+                ORDER BY price_per_gram ASC
+                LIMIT %(limit)s
+            ''', params).fetchall()
+        return [_iso_timestamp(row) for row in rows]
+
+    def shop_leaderboard(self) -> List[Dict]:
+        with self.connection() as conn:
+            return conn.execute(f'''
+                WITH ranked AS (
+                    SELECT shop_name, product_id, price_per_gram,
+                           MIN(price_per_gram) OVER (PARTITION BY product_id) AS best
+                    FROM ({LATEST_DEALS}) latest
+                    WHERE price_per_gram > 0
+                )
+                SELECT shop_name,
+                       COUNT(DISTINCT product_id) AS products,
+                       COUNT(DISTINCT CASE WHEN price_per_gram = best THEN product_id END) AS cheapest,
+                       ROUND(AVG(price_per_gram / best)::numeric, 3)::float8 AS avg_price_ratio
+                FROM ranked
+                GROUP BY shop_name
+                ORDER BY cheapest DESC, avg_price_ratio ASC
+            ''').fetchall()
+
+    def distinct_amounts(self) -> List[str]:
+        with self.connection() as conn:
+            rows = conn.execute('SELECT DISTINCT amount FROM price_history').fetchall()
+        return [row['amount'] for row in rows]
+
+    def apply_unit_updates(self, updates: List[Tuple[str, float, str]], dry_run: bool = False) -> int:
+        if not updates:
+            return 0
+        amounts, quantities, units = (list(column) for column in zip(*updates))
+        with self.connection() as conn:
+            # One set-based UPDATE joined against the unnested update arrays
+            changed = conn.execute('''
+                WITH v AS (
+                    SELECT * FROM unnest(%s::text[], %s::float8[], %s::text[]) AS v(amount, quantity, unit)
+                ),
+                computed AS (
+                    SELECT ph.id, v.unit,
+                           CASE WHEN v.quantity > 0 THEN ph.price / v.quantity ELSE 0 END AS price_per_gram
+                    FROM price_history ph
+                    JOIN v ON ph.amount IS NOT DISTINCT FROM v.amount
+                )
+                UPDATE price_history ph
+                SET price_per_gram = computed.price_per_gram, unit = computed.unit
+                FROM computed
+                WHERE ph.id = computed.id
+                  AND (ph.unit IS DISTINCT FROM computed.unit
+                       OR ph.price_per_gram IS DISTINCT FROM computed.price_per_gram)
+            ''', (amounts, quantities, units)).rowcount
+            if dry_run:
+                conn.rollback()
+            elif changed:
+                bump_generation(conn)
+        return changed
+
+    def products_by_ids(self, product_ids: List[int]) -> List[Dict]:
+        if not product_ids:
+            return []
+        with self.connection() as conn:
+            return conn.execute('SELECT id, name, url FROM products WHERE id = ANY(%s) ORDER BY id',
+                                (list(product_ids),)).fetchall()
+
+    def product_id_for_url(self, url: str) -> Optional[int]:
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT id FROM products WHERE url = %(url)s
+                UNION ALL
+                SELECT product_id FROM product_aliases WHERE url = %(url)s
+            ''', {'url': url}).fetchone()
+        return row['id'] if row else None
+
+    def add_product_alias(self, url: str, product_id: int):
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO product_aliases (url, product_id) VALUES (%s, %s)
+                ON CONFLICT (url) DO UPDATE SET product_id = EXCLUDED.product_id
+            ''', (url, product_id))
+
+    def merge_products(self, target_id: int, duplicate_ids: List[int]) -> int:
+        duplicate_ids = [product_id for product_id in duplicate_ids if product_id != target_id]
+        if not duplicate_ids:
+            return 0
+        params = {'target': target_id, 'duplicates': duplicate_ids}
+        with self.connection() as conn:
+            relinked = conn.execute('''
+                UPDATE price_history SET product_id = %(target)s WHERE product_id = ANY(%(duplicates)s)
+            ''', params).rowcount
+            conn.execute('''
+                INSERT INTO product_aliases (url, product_id)
+                SELECT url, %(target)s FROM products WHERE id = ANY(%(duplicates)s)
+                ON CONFLICT (url) DO UPDATE SET product_id = EXCLUDED.product_id
+            ''', params)
+            conn.execute('''
+                UPDATE product_aliases SET product_id = %(target)s WHERE product_id = ANY(%(duplicates)s)
+            ''', params)
+            conn.execute('DELETE FROM products WHERE id = ANY(%(duplicates)s)', params)
+            bump_generation(conn)
+        return relinked
+
+    def data_generation(self) -> int:
+        with self.connection() as conn:
+            row = conn.execute('SELECT MAX(generation) AS generation FROM data_generation').fetchone()
+        return row['generation'] or 0
+
+    def record_archived_page(self, url: str, source: str, sha256: str,
+                             fetched_at: str, rows_saved: int) -> int:
+        with self.connection() as conn:
+            return conn.execute('''
+                INSERT INTO page_archive (url, source, sha256, fetched_at, rows_saved)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (url, source, sha256, fetched_at, rows_saved)).fetchone()['id']
+
+    def archived_pages(self, since: Optional[str] = None, until: Optional[str] = None,
+                       only_empty: bool = True) -> List[Dict]:
+        where = ['TRUE']
+        params = {'since': since, 'until': until}
+        if only_empty:
+            where.append('rows_saved = 0')
+        if since:
+            where.append('fetched_at >= %(since)s::date')
+        if until:
+            where.append('fetched_at < %(until)s::date + 1')
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, url, source, sha256, fetched_at, rows_saved FROM page_archive
+                WHERE {' AND '.join(where)}
+                ORDER BY fetched_at
+            ''', params).fetchall()
+        for row in rows:
+            row['fetched_at'] = row['fetched_at'].isoformat()
+        return rows
+
+    def update_archived_page(self, page_id: int, rows_saved: int):
+        with self.connection() as conn:
+            conn.execute('UPDATE page_archive SET rows_saved = %s WHERE id = %s', (rows_saved, page_id))
+
+    def max_history_id(self) -> int:
+        with self.connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) AS id FROM price_history').fetchone()['id']
+
+    def history_since(self, after_id: int, limit: int = 1000) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(HISTORY_FIELDS)}
+                FROM price_history
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            ''', (after_id, limit)).fetchall()
+        return [_iso_timestamp(row) for row in rows]
+
+    def latest_history(self, up_to_id: int) -> List[Dict]:
+        columns = ', '.join(f'ph.{field}' for field in HISTORY_FIELDS)
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {columns}
+                FROM products p
+                JOIN price_history ph
+                  ON ph.product_id = p.id
+                 AND ph.fetch_timestamp = (
+                     SELECT MAX(fetch_timestamp) FROM price_history
+                     WHERE product_id = p.id AND id <= %(up_to_id)s
+                 )
+                WHERE ph.id <= %(up_to_id)s
+                ORDER BY ph.id
+            ''', {'up_to_id': up_to_id}).fetchall()
+        return [_iso_timestamp(row) for row in rows]
+
+    def history_at(self, product_id: int, fetch_timestamp: str) -> List[Dict]:
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(HISTORY_FIELDS)}
+                FROM price_history
+                WHERE product_id = %s AND fetch_timestamp = %s
+                ORDER BY id
+            ''', (product_id, fetch_timestamp)).fetchall()
+        return [_iso_timestamp(row) for row in rows]
+
+    def close(self):
+        self.pool.close()
+
+def _iso_timestamp(row: Dict) -> Dict:
+    """Render fetch_timestamp like the SQLite backend stores it"""
+    if isinstance(row.get('fetch_timestamp'), datetime):
+        row['fetch_timestamp'] = row['fetch_timestamp'].isoformat()
+    return row
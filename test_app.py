@@ -0,0 +1,121 @@
+# test_app.py
+from datetime import date, timedelta
+
+import pytest
+from flask import request
+
+import app
+import storage
+from storage import SQLiteRepository
+
+def deal(shop_name, price):
+    return {'shop_name': shop_name, 'price': f'{price},90 Kč', 'amount': '100 g',
+            'price_per_gram': price / 100, 'unit': 'g', 'expiration': 'do 31.12.',
+            'shops_valid': 'všechny', 'additional_note': ''}
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'test.db'))
+    repository.setup()
+    # Point the app at a throwaway database and start it afresh, without the scheduler
+    monkeypatch.setattr(storage, '_repository', repository)
+    monkeypatch.setattr(app, '_price_index', None)
+    monkeypatch.setattr(app, '_started', False)
+    monkeypatch.setattr(app, 'SCHEDULER_ENABLED', False)
+    return repository
+
+@pytest.fixture
+def client(repo):
+    return app.app.test_client()
+
+def test_cheapest_clamps_limit(repo, client):
+    repo.save_product_data('https://example.com/a', {'name': 'Tuňák', 'discounts': [deal('Lidl', 30),
+                                                                                   deal('Tesco', 25)]},
+                           '2024-01-01T10:00:00')
+    assert len(client.get('/api/cheapest?limit=-1').get_json()) == 1
+    assert len(client.get('/api/cheapest?limit=1000').get_json()) == 2
+
+@pytest.mark.parametrize('days', ['0', '-1', '100000000'])
+def test_cheapest_rejects_bad_days(client, days):
+    assert client.get(f'/api/cheapest?days={days}').status_code == 400
+
+def test_cheapest_filters_by_days(repo, client):
+    repo.save_product_data('https://example.com/a', {'name': 'Tuňák', 'discounts': [deal('Lidl', 30)]},
+                           '2024-01-01T10:00:00')
+    response = client.get('/api/cheapest?days=7')
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+def test_failed_startup_is_retried(repo, client, monkeypatch):
+    setup = repo.setup
+    calls = []
+
+    def setup_once_locked():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        setup()
+    monkeypatch.setattr(repo, 'setup', setup_once_locked)
+
+    assert client.get('/api/shops/leaderboard').status_code == 500
+    assert not app._started
+    assert client.get('/api/shops/leaderboard').status_code == 200
+    assert app._started
+
+def test_changes_pages_with_next_since(repo, client):
+    for n, name in enumerate(['Tuňák', 'Máslo']):
+        repo.save_product_data(f'https://example.com/{n}', {'name': name, 'discounts': [deal('Lidl', 30),
+                                                                                       deal('Tesco', 25)]},
+                               '2024-01-01T10:00:00')
+
+    first = client.get('/api/changes?limit=3').get_json()
+    assert [record['cursor'] for record in first['changes'] if record['type'] == 'price'] == [1, 2, 3]
+    assert (first['next_since'], first['has_more']) == (3, True)
+    assert first['data_generation'] == repo.data_generation()
+
+    last = client.get(f"/api/changes?since={first['next_since']}&limit=3").get_json()
+    assert [record['cursor'] for record in last['changes'] if record['type'] == 'price'] == [4]
+    assert (last['next_since'], last['has_more']) == (4, False)
+
+    # Caught up: the cursor stays put
+    empty = client.get('/api/changes?since=4').get_json()
+    assert (empty['changes'], empty['next_since'], empty['has_more']) == ([], 4, False)
+
+def save_days(repo, days):
+    """One scrape a day for days days, with Lidl, Tesco and Albert prices varying"""
+    for n in range(days):
+        repo.save_product_data('https://example.com/a', {'name': 'Tuňák', 'discounts': [
+            deal('Lidl', 20 + n % 7), deal('Tesco', 21 + n % 5), deal('Albert', 22 + n % 3)
+        ]}, f'{date(2024, 1, 1) + timedelta(days=n)}T10:00:00')
+
+def test_price_history_payload_is_bounded(repo):
+    save_days(repo, 150)
+
+    single = app.get_price_history(1, max_points=60)
+    assert [len(points) for points in single['series'].values()] == [60]
+    assert (single['series']['Lowest Price'][0]['date'], single['series']['Lowest Price'][-1]['date']) == \
+           ('2024-01-01', '2024-05-29')
+
+    per_shop = app.get_price_history(1, per_shop=True, max_points=60)
+    assert sorted(per_shop['series']) == ['Albert', 'Lidl', 'Tesco']
+    assert sum(len(points) for points in per_shop['series'].values()) == 60
+
+    # Short ranges are sent as they are
+    filtered = app.get_price_history(1, start='2024-01-10', end='2024-01-19', shop='Tesco')
+    assert [point['shops'] for point in filtered['series']['Lowest Price']] == ['Tesco'] * 10
+    assert app.get_price_history(99) is None
+
+def test_history_page_filters(repo, client):
+    save_days(repo, 30)
+    assert client.get('/product/1/history?start=2024-01-10&end=2024-01-19&shop=Tesco&per_shop=1'
+                      '&points=5000').status_code == 200
+    assert client.get('/product/1/history?start=2024-13-01').status_code == 400
+    assert client.get('/product/99/history').status_code == 404
+
+    with app.app.test_request_context('/?start=2024-01-10&shop=&per_shop=1&points=5000'):
+        assert app.history_filters(request.args) == {
+            'start': '2024-01-10', 'end': None, 'shop': None, 'per_shop': True,
+            'max_points': app.MAX_CHART_POINTS
+        }
+    with app.app.test_request_context('/?points=1'):
+        assert app.history_filters(request.args)['max_points'] == 2
@@ -0,0 +1,69 @@
+# test_archive.py
+import archive
+from storage import SQLiteRepository
+
+ROW = '''
+<tr class="discount_row">
+    <td><span class="discounts_shop_name"><span>{shop}</span></span></td>
+    <td><strong class="discount_price_value">{price} Kč</strong><div class="discount_amount">/ 100 g</div></td>
+    <td class="discounts_validity"><span>do 31.12.</span></td>
+</tr>
+'''
+
+def page(name, *rows):
+    return (f'<html><body><h1>{name}</h1><table class="wide discounts_table">{"".join(rows)}</table>'
+            f'</body></html>').encode()
+
+def test_reparse_skips_pages_that_fail(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'test.db'))
+    repo.setup()
+    archive_dir = str(tmp_path / 'archive')
+    pages = {
+        'https://www.kupi.cz/sleva/a': page('Tuňák', ROW.format(shop='Lidl', price='29,90')),
+        # Shop name markup the parser cannot handle
+        'https://www.kupi.cz/sleva/b': page('Máslo', '<tr class="discount_row"><td>'
+                                                      '<span class="discounts_shop_name">Billa</span></td></tr>'),
+        'https://www.kupi.cz/sleva/c': page('Čokoláda', ROW.format(shop='Tesco', price='19,90'),
+                                            ROW.format(shop='Albert', price='21,90')),
+    }
+    for url, html in pages.items():
+        repo.record_archived_page(url, 'kupi.cz', archive.store_page(html, archive_dir),
+                                  '2024-01-01T10:00:00', 0)
+    # Catalogued, but its archive file is gone
+    repo.record_archived_page('https://www.kupi.cz/sleva/d', 'kupi.cz', 'ff' * 32, '2024-01-01T10:00:00', 0)
+
+    assert archive.reparse_archive(repo, workers=2, archive_dir=archive_dir) == 3
+
+    deals = {product['url']: repo.latest_deals(product['id']) for product in repo.list_products()}
+    assert [deal['shop_name'] for deal in deals['https://www.kupi.cz/sleva/a']] == ['Lidl']
+    assert [deal['shop_name'] for deal in deals['https://www.kupi.cz/sleva/c']] == ['Tesco', 'Albert']
+    assert [p['url'] for p in repo.archived_pages()] == ['https://www.kupi.cz/sleva/b',
+                                                         'https://www.kupi.cz/sleva/d']
+
+def test_reparse_matches_products_and_skips_offers_saved_that_run(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'test.db'))
+    repo.setup()
+    archive_dir = str(tmp_path / 'archive')
+    fetched_at = '2024-01-01T10:00:00'
+    # Saved by the run from the shop's own page
+    product_id = repo.save_product_data('https://www.kupi.cz/sleva/jogurt', {
+        'name': 'Jogurt bílý 3% 150g',
+        'discounts': [{'shop_name': 'Lidl', 'price': '29,90 Kč', 'amount': '100 g', 'price_per_gram': 0.299,
+                       'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'N/A', 'additional_note': ''}]
+    }, fetched_at)
+    # Pages of the same run the parser failed on back then
+    pages = {
+        'https://www.kupi.cz/sleva/jogurt-bily': page('Jogurt Bílý 3 % 150 g', ROW.format(shop='Lidl', price='29,90'),
+                                                      ROW.format(shop='Billa', price='31,90')),
+        'https://www.kupi.cz/sleva/jogurt-0': page('Jogurt bílý 0% 150g', ROW.format(shop='Tesco', price='27,90')),
+    }
+    for url, html in pages.items():
+        repo.record_archived_page(url, 'kupi.cz', archive.store_page(html, archive_dir), fetched_at, 0)
+
+    assert archive.reparse_archive(repo, workers=1, archive_dir=archive_dir) == 2
+
+    assert repo.product_id_for_url('https://www.kupi.cz/sleva/jogurt-bily') == product_id
+    assert repo.product_id_for_url('https://www.kupi.cz/sleva/jogurt-0') != product_id
+    assert len(repo.list_products()) == 2
+    assert sorted(deal['shop_name'] for deal in repo.latest_deals(product_id, limit=10)) == ['Billa', 'Lidl']
+    assert repo.archived_pages() == []
@@ -0,0 +1,63 @@
+# test_asgi.py
+import asyncio
+
+import pytest
+
+pytest.importorskip('quart')
+
+import app
+import asgi
+import storage
+from storage import SQLiteRepository
+
+PATHS = [
+    '/',
+    '/product/1/history?points=10&per_shop=1',
+    '/product/99/history',
+    '/api/basket',
+    '/api/basket?product_id=1',
+    '/api/cheapest?limit=-1',
+    '/api/cheapest?days=100000000',
+    '/api/top-deals?n=-1',
+    '/api/changes?limit=1',
+    '/api/shops/leaderboard',
+]
+
+def deal(shop_name, price):
+    return {'shop_name': shop_name, 'price': f'{price},90 Kč', 'amount': '100 g',
+            'price_per_gram': price / 100, 'unit': 'g', 'expiration': 'do 31.12.',
+            'shops_valid': 'všechny', 'additional_note': ''}
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'test.db'))
+    repository.setup()
+    repository.save_product_data('https://example.com/a', {'name': 'Tuňák', 'discounts': [deal('Lidl', 30),
+                                                                                          deal('Tesco', 25)]},
+                                 '2024-01-01T10:00:00')
+    monkeypatch.setattr(storage, '_repository', repository)
+    monkeypatch.setattr(app, '_price_index', None)
+    monkeypatch.setattr(app, '_started', False)
+    monkeypatch.setattr(app, 'SCHEDULER_ENABLED', False)
+    return repository
+
+async def asgi_responses(paths):
+    # The bare test client skips before/after_serving, which would shut down
+    # the shared DB thread pool
+    client = asgi.app.test_client()
+    responses = []
+    for path in paths:
+        response = await client.get(path)
+        body = await response.get_json() if response.mimetype == 'application/json' else None
+        responses.append((response.status_code, body))
+    return responses
+
+def test_asgi_routes_match_wsgi(repo):
+    client = app.app.test_client()
+    expected = []
+    for path in PATHS:
+        response = client.get(path)
+        expected.append((response.status_code, response.get_json() if response.is_json else None))
+
+    assert asyncio.run(asgi_responses(PATHS)) == expected
+    assert [status for status, _ in expected] == [200, 200, 404, 400, 200, 200, 400, 200, 200, 200]
@@ -0,0 +1,52 @@
+# test_changes.py
+import json
+import sys
+
+import pytest
+
+import changes
+from matching import merge_duplicates
+from storage import SQLiteRepository
+
+def deal(shop_name, price):
+    return {'shop_name': shop_name, 'price': f'{price},90 Kč', 'amount': '100 g',
+            'price_per_gram': price / 100, 'unit': 'g', 'expiration': 'do 31.12.',
+            'shops_valid': 'všechny', 'additional_note': ''}
+
+@pytest.fixture
+def repo(tmp_path):
+    repository = SQLiteRepository(str(tmp_path / 'test.db'))
+    repository.setup()
+    # Three products with two price rows each: cursors 1..6
+    for n, name in enumerate(['Tuňák', 'Máslo', 'Čokoláda']):
+        repository.save_product_data(f'https://example.com/{n}', {'name': name, 'discounts': [deal('Lidl', 30 + n),
+                                                                                            deal('Tesco', 20 + n)]},
+                                     '2024-01-01T10:00:00')
+    return repository
+
+def cursors(records):
+    return [record['cursor'] for record in records if record['type'] == 'price']
+
+def test_iter_changes_pages_through_every_row(repo):
+    records = list(changes.iter_changes(repo, batch_size=4))
+    assert cursors(records) == [1, 2, 3, 4, 5, 6]
+    # Each batch names its products before their prices
+    assert [record['type'] for record in records] == ['product', 'product'] + ['price'] * 4 + \
+                                                     ['product'] + ['price'] * 2
+
+def test_iter_changes_resumes_after_cursor_and_stops_at_limit(repo):
+    assert cursors(changes.iter_changes(repo, since=2, batch_size=2, limit=3)) == [3, 4, 5]
+    assert cursors(changes.iter_changes(repo, since=6)) == []
+
+def test_export_starts_with_data_generation(repo, monkeypatch, capsys):
+    repo.save_product_data('https://example.com/dup', {'name': 'Tuňák', 'discounts': [deal('Billa', 25)]},
+                           '2024-01-02T10:00:00')
+    merge_duplicates(repo)
+
+    monkeypatch.setattr(sys, 'argv', ['changes.py', '--db', repo.db_path, '--since', '5'])
+    changes.main()
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert records[0] == {'type': 'generation', 'data_generation': repo.data_generation()}
+    assert records[0]['data_generation'] > 0
+    assert cursors(records) == [6, 7]
@@ -0,0 +1,37 @@
+# test_downsample.py
+from datetime import date, timedelta
+
+from app import downsample_history
+from downsample import lttb
+
+def test_lttb_keeps_short_series():
+    assert lttb([0, 1, 2], [5, 6, 7], 10) == [0, 1, 2]
+    assert lttb([0, 1, 2], [5, 6, 7], 3) == [0, 1, 2]
+
+def test_lttb_keeps_endpoints_and_threshold():
+    xs = list(range(1000))
+    ys = [(x * 37) % 101 for x in xs]
+    kept = lttb(xs, ys, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert kept == sorted(set(kept))
+
+def test_lttb_keeps_a_spike():
+    ys = [10.0] * 500
+    ys[250] = 99.0
+    assert 250 in lttb(list(range(500)), ys, 20)
+
+def test_lttb_tiny_threshold():
+    assert lttb(list(range(10)), [1] * 10, 2) == [0, 9]
+    assert lttb(list(range(10)), [1] * 10, 0) == [0, 9]
+
+def test_downsample_history():
+    first = date(2024, 1, 1)
+    points = [{'date': (first + timedelta(days=n)).isoformat(), 'price': 20 + n % 7, 'shops': 'Lidl'}
+              for n in range(365)]
+    assert downsample_history(points[:30], 50) == points[:30]
+
+    reduced = downsample_history(points, 50)
+    assert len(reduced) == 50
+    assert reduced[0] == points[0] and reduced[-1] == points[-1]
+    assert all(point in points for point in reduced)
@@ -0,0 +1,50 @@
+# test_matching.py
+import pytest
+
+from matching import NameIndex, find_duplicates, identity_tokens, resolve_product_url
+from storage import SQLiteRepository
+
+@pytest.mark.parametrize('name, other', [
+    ('Tuňák v oleji Rio Mare 160g', 'Tuňák v oleji Rio Mare'),
+    ('Tuňák v oleji Rio Mare 160g', 'TUNAK V OLEJI RIO MARE 2x 80 g'),
+    ('Jogurt bílý 3% 150g', 'Jogurt Bílý 3 % 150 g'),
+    ('Coca-Cola Zero kolový nápoj 1,5 l', 'Coca-Cola Zero kolový nápoj 330 ml'),
+])
+def test_same_product_matches(name, other):
+    index = NameIndex()
+    index.add(1, name)
+    assert index.match(other)[0] == 1
+
+@pytest.mark.parametrize('name, other', [
+    # Close enough by shingles alone, but a different fat content, degree or variant
+    ('Jogurt bílý 3%', 'Jogurt bílý 0%'),
+    ('Mléko polotučné 1,5%', 'Mléko polotučné 3,5%'),
+    ('Madeta Jihočeský Eidam 30% 100g', 'Madeta Jihočeský eidam 45% 100 g'),
+    ('Coca-Cola Zero kolový nápoj v plechovce 330 ml', 'Coca-Cola kolový nápoj v plechovce 330 ml'),
+    ('Radegast Ryze hořká světlé výčepní pivo 0,5 l', 'Radegast Ryze hořká nealko světlé výčepní pivo 0,5 l'),
+])
+def test_variants_do_not_match(name, other):
+    index = NameIndex()
+    index.add(1, name)
+    assert index.match(other) is None
+    assert find_duplicates([{'id': 1, 'name': name}, {'id': 2, 'name': other}]) == []
+
+def test_identity_tokens_ignore_pack_sizes():
+    assert identity_tokens('Jogurt bílý 3% 150g') == {'3'}
+    assert identity_tokens('Pivo nealko 6x 0,5 l') == {'nealko'}
+
+def test_find_duplicates_groups_only_same_variant():
+    products = [{'id': 1, 'name': 'Jogurt bílý 3% 150g'}, {'id': 2, 'name': 'Jogurt bílý 0% 150g'},
+                {'id': 3, 'name': 'Jogurt Bílý 3 % 150 g'}, {'id': 4, 'name': 'Jogurt bílý 0 %'}]
+    assert sorted(find_duplicates(products)) == [[1, 3], [2, 4]]
+
+def test_resolve_keeps_variant_url_separate(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'test.db'))
+    repo.setup()
+    product_id = repo.save_product_data('https://example.com/jogurt-3', {'name': 'Jogurt bílý 3%', 'discounts': []},
+                                        '2024-01-01T10:00:00')
+    names = NameIndex.from_repository(repo)
+
+    assert resolve_product_url(repo, names, 'https://example.com/jogurt-0', 'Jogurt bílý 0%') is None
+    assert repo.product_id_for_url('https://example.com/jogurt-0') is None
+    assert resolve_product_url(repo, names, 'https://other.example/jogurt', 'Jogurt Bílý 3 %') == product_id
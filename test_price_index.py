@@ -0,0 +1,46 @@
+# test_price_index.py
+from matching import merge_duplicates
+from price_index import PriceIndex
+from storage import SQLiteRepository
+
+def deal(shop_name, price):
+    return {'shop_name': shop_name, 'price': f'{price},90 Kč', 'amount': '100 g',
+            'price_per_gram': price / 100, 'unit': 'g', 'expiration': 'do 31.12.',
+            'shops_valid': 'všechny', 'additional_note': ''}
+
+def test_index_rebuilds_after_merge(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'test.db'))
+    repo.setup()
+    target = repo.save_product_data('https://example.com/a', {'name': 'Tuňák v oleji', 'discounts': [deal('Lidl', 30)]},
+                                    '2024-01-01T10:00:00')
+    duplicate = repo.save_product_data('https://example.com/b', {'name': 'Tuňák v oleji 160g',
+                                                                 'discounts': [deal('Tesco', 25)]},
+                                       '2024-01-01T10:00:00')
+    index = PriceIndex(repo, refresh_interval=0)
+    index.rebuild()
+    assert sorted(product['id'] for product in index.get_product_data()) == [target, duplicate]
+
+    merge_duplicates(repo)
+    index.refresh_if_stale()
+
+    products = index.get_product_data(deals_per_product=10)
+    assert [product['id'] for product in products] == [target]
+    assert [deal['shop_name'] for deal in products[0]['deals']] == ['Tesco', 'Lidl']
+    assert [deal['product_id'] for deal in index.top_deals()] == [target, target]
+
+def test_refresh_picks_up_products_without_deals(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / 'test.db'))
+    repo.setup()
+    first = repo.save_product_data('https://example.com/a', {'name': 'Tuňák v oleji', 'discounts': [deal('Lidl', 30)]},
+                                   '2024-01-01T10:00:00')
+    index = PriceIndex(repo, refresh_interval=0)
+    index.rebuild()
+
+    # Tracked, but currently on sale nowhere
+    second = repo.save_product_data('https://example.com/b', {'name': 'Máslo', 'discounts': []},
+                                    '2024-01-02T10:00:00')
+    index.refresh_if_stale()
+
+    products = index.get_product_data()
+    assert [product['id'] for product in products] == [first, second]
+    assert products[1]['deals'] == []
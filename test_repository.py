@@ -0,0 +1,281 @@
+# test_repository.py
+import os
+import sqlite3
+import threading
+import uuid
+
+import pytest
+
+from storage import SQLiteRepository
+
+# Postgres runs against DATABASE_URL when it points at a server, otherwise an
+# embedded pgserver instance; without either those cases are skipped
+BACKENDS = ['sqlite', 'postgres']
+
+@pytest.fixture(scope='session')
+def postgres_url(tmp_path_factory):
+    url = os.environ.get('DATABASE_URL', '')
+    if url.startswith(('postgresql://', 'postgres://')):
+        return url
+    try:
+        import pgserver
+    except ImportError:
+        pytest.skip('PostgreSQL not available: set DATABASE_URL or install pgserver')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+    return server.get_uri()
+
+@pytest.fixture(params=BACKENDS)
+def repo(request, tmp_path):
+    if request.param == 'sqlite':
+        repository = SQLiteRepository(str(tmp_path / 'test.db'))
+        repository.setup()
+        yield repository
+        repository.close()
+        return
+
+    psycopg = pytest.importorskip('psycopg')
+    from psycopg.conninfo import make_conninfo
+    from storage_postgres import PostgresRepository
+
+    # A throwaway database per test keeps ids and tables independent
+    url = request.getfixturevalue('postgres_url')
+    name = f'price_tracker_test_{uuid.uuid4().hex[:12]}'
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f'CREATE DATABASE {name}')
+    repository = PostgresRepository(make_conninfo(url, dbname=name))
+    try:
+        repository.setup()
+        yield repository
+    finally:
+        repository.close()
+        with psycopg.connect(url, autocommit=True) as admin:
+            admin.execute(f'DROP DATABASE IF EXISTS {name} WITH (FORCE)')
+
+def discount(shop_name, price, amount='100 g', price_per_gram=None, unit='g', expiration='do 31.12.'):
+    return {
+        'shop_name': shop_name,
+        'price': f'{price:.2f}'.replace('.', ',') + ' Kč',
+        'amount': amount,
+        'price_per_gram': price / 100 if price_per_gram is None else price_per_gram,
+        'unit': unit,
+        'expiration': expiration,
+        'shops_valid': 'všechny',
+        'additional_note': ''
+    }
+
+def product(name, *discounts):
+    return {'name': name, 'discounts': list(discounts)}
+
+def test_save_product_data_reuses_product_per_url(repo):
+    first = repo.save_product_data('https://example.com/a', product('Tuňák', discount('Lidl', 30)),
+                                   '2024-01-01T10:00:00')
+    again = repo.save_product_data('https://example.com/a', product('Tuňák', discount('Lidl', 31)),
+                                   '2024-01-02T10:00:00')
+    other = repo.save_product_data('https://example.com/b', product('Čokoláda'), '2024-01-02T10:00:00')
+
+    assert first == again != other
+    assert repo.get_product(first) == {'id': first, 'name': 'Tuňák', 'url': 'https://example.com/a'}
+    assert repo.get_product(other + 1000) is None
+    assert [p['id'] for p in repo.list_products()] == [first, other]
+    assert repo.product_id_for_url('https://example.com/a') == first
+    assert repo.product_id_for_url('https://example.com/unknown') is None
+
+def test_latest_deals_come_from_latest_scrape(repo):
+    url = 'https://example.com/a'
+    product_id = repo.save_product_data(url, product('Tuňák', discount('Lidl', 20), discount('Tesco', 25)),
+                                        '2024-01-01T10:00:00')
+    repo.save_product_data(url, product('Tuňák', discount('Albert', 40), discount('Billa', 35),
+                                        discount('Penny', 50), discount('Tesco', 45)),
+                           '2024-01-02T10:00:00')
+
+    deals = repo.latest_deals(product_id, limit=3)
+    assert [deal['shop_name'] for deal in deals] == ['Billa', 'Albert', 'Tesco']
+    assert deals[0]['price'] == 35.0
+    assert deals[0]['fetch_timestamp'] == '2024-01-02T10:00:00'
+    assert deals[0]['unit'] == 'g'
+    assert repo.product_shops(product_id) == ['Albert', 'Billa', 'Lidl', 'Penny', 'Tesco']
+
+def test_daily_lowest_prices(repo):
+    url = 'https://example.com/a'
+    product_id = repo.save_product_data(url, product('Tuňák', discount('Lidl', 30), discount('Tesco', 25)),
+                                        '2024-01-01T08:00:00')
+    repo.save_product_data(url, product('Tuňák', discount('Lidl', 20)), '2024-01-01T20:00:00')
+    repo.save_product_data(url, product('Tuňák', discount('Lidl', 22), discount('Tesco', 28)),
+                           '2024-01-02T08:00:00')
+
+    assert repo.daily_lowest_prices(product_id) == [
+        {'date': '2024-01-01', 'price': 20.0, 'shops': 'Lidl'},
+        {'date': '2024-01-02', 'price': 22.0, 'shops': 'Lidl'},
+    ]
+    assert repo.daily_lowest_prices(product_id, shop='Tesco') == [
+        {'date': '2024-01-01', 'price': 25.0, 'shops': 'Tesco'},
+        {'date': '2024-01-02', 'price': 28.0, 'shops': 'Tesco'},
+    ]
+    assert repo.daily_lowest_prices(product_id, start='2024-01-02', end='2024-01-02') == [
+        {'date': '2024-01-02', 'price': 22.0, 'shops': 'Lidl'},
+    ]
+    per_shop = repo.daily_lowest_prices(product_id, end='2024-01-01', per_shop=True)
+    assert sorted((row['shops'], row['price']) for row in per_shop) == [('Lidl', 20.0), ('Tesco', 25.0)]
+
+def test_basket_cost_by_shop(repo):
+    tuna = repo.save_product_data('https://example.com/a', product('Tuňák', discount('Lidl', 30),
+                                                                   discount('Tesco', 25)),
+                                  '2024-01-01T10:00:00')
+    chocolate = repo.save_product_data('https://example.com/b', product('Čokoláda', discount('Lidl', 20),
+                                                                        discount('Lidl', 18, amount='90 g')),
+                                       '2024-01-01T10:00:00')
+
+    assert repo.basket_cost_by_shop([tuna, chocolate]) == [
+        {'shop_name': 'Lidl', 'total': 48.0, 'items': 2, 'missing': []},
+        {'shop_name': 'Tesco', 'total': 25.0, 'items': 1, 'missing': [chocolate]},
+    ]
+    assert repo.basket_cost_by_shop([]) == []
+
+def test_cheapest_deals_and_leaderboard(repo):
+    repo.save_product_data('https://example.com/a', product('Tuňák v oleji', discount('Lidl', 30),
+                                                            discount('Tesco', 25)),
+                           '2024-01-01T10:00:00')
+    repo.save_product_data('https://example.com/b', product('Mléko', discount('Lidl', 20, amount='1 l',
+                                                                               price_per_gram=0.02, unit='ml')),
+                           '2024-01-01T10:00:00')
+
+    assert [deal['shop_name'] for deal in repo.cheapest_deals(unit='g')] == ['Tesco', 'Lidl']
+    assert [deal['product_name'] for deal in repo.cheapest_deals(unit='ml')] == ['Mléko']
+    assert repo.cheapest_deals(name_query='oleji', limit=1)[0]['price'] == 25.0
+    assert repo.cheapest_deals(since='2024-02-01') == []
+
+    leaderboard = repo.shop_leaderboard()
+    assert [(shop['shop_name'], shop['cheapest'], shop['avg_price_ratio']) for shop in leaderboard] == [
+        ('Tesco', 1, 1.0), ('Lidl', 1, 1.1)
+    ]
+
+def test_apply_unit_updates(repo):
+    product_id = repo.save_product_data(
+        'https://example.com/a',
+        product('Mléko', discount('Lidl', 20, amount='1 l', price_per_gram=0, unit=None),
+                discount('Tesco', 30, amount='2x 500 ml', price_per_gram=0, unit=None)),
+        '2024-01-01T10:00:00')
+    assert sorted(repo.distinct_amounts()) == ['1 l', '2x 500 ml']
+    updates = [('1 l', 1000.0, 'ml'), ('2x 500 ml', 1000.0, 'ml')]
+
+    assert repo.apply_unit_updates(updates, dry_run=True) == 2
+    assert {deal['price_per_gram'] for deal in repo.latest_deals(product_id)} == {0}
+
+    assert repo.apply_unit_updates(updates) == 2
+    deals = repo.latest_deals(product_id)
+    assert [(deal['price_per_gram'], deal['unit']) for deal in deals] == [(0.02, 'ml'), (0.03, 'ml')]
+    assert repo.apply_unit_updates(updates) == 0
+
+def test_aliases_and_merge(repo):
+    target = repo.save_product_data('https://example.com/a', product('Tuňák', discount('Lidl', 30)),
+                                    '2024-01-01T10:00:00')
+    duplicate = repo.save_product_data('https://example.com/b', product('Tuňák', discount('Tesco', 25)),
+                                       '2024-01-01T10:00:00')
+    repo.add_product_alias('https://example.com/c', duplicate)
+
+    assert repo.merge_products(target, [duplicate, target]) == 1
+    assert repo.get_product(duplicate) is None
+    assert repo.product_id_for_url('https://example.com/b') == target
+    assert repo.product_id_for_url('https://example.com/c') == target
+    assert repo.save_product_data('https://example.com/c', product('Tuňák'), '2024-01-02T10:00:00') == target
+    assert repo.product_shops(target) == ['Lidl', 'Tesco']
+
+def test_history_since_and_latest_history(repo):
+    url = 'https://example.com/a'
+    product_id = repo.save_product_data(url, product('Tuňák', discount('Lidl', 30), discount('Tesco', 25)),
+                                        '2024-01-01T10:00:00')
+    assert repo.max_history_id() > 0
+    first_scrape = repo.max_history_id()
+    repo.save_product_data(url, product('Tuňák', discount('Lidl', 28)), '2024-01-02T10:00:00')
+
+    rows = repo.history_since(0)
+    assert [row['price'] for row in rows] == [30.0, 25.0, 28.0]
+    assert rows[0]['product_id'] == product_id
+    assert rows[0]['fetch_timestamp'] == '2024-01-01T10:00:00'
+    assert repo.history_since(rows[0]['id'], limit=1) == [rows[1]]
+
+    assert [row['price'] for row in repo.latest_history(first_scrape)] == [30.0, 25.0]
+    assert [row['price'] for row in repo.latest_history(repo.max_history_id())] == [28.0]
+    assert repo.products_by_ids([product_id]) == [{'id': product_id, 'name': 'Tuňák', 'url': url}]
+    assert repo.history_at(product_id, '2024-01-01T10:00:00') == rows[:2]
+    assert repo.history_at(product_id, '2024-01-03T10:00:00') == []
+
+def test_archived_pages(repo):
+    empty = repo.record_archived_page('https://example.com/a', 'kupi.cz', 'ab' * 32, '2024-01-01T10:00:00', 0)
+    repo.record_archived_page('https://example.com/b', 'kupi.cz', 'cd' * 32, '2024-01-02T10:00:00', 3)
+
+    pages = repo.archived_pages()
+    assert [(page['id'], page['url'], page['fetched_at']) for page in pages] == [
+        (empty, 'https://example.com/a', '2024-01-01T10:00:00')
+    ]
+    assert len(repo.archived_pages(only_empty=False)) == 2
+    assert len(repo.archived_pages(since='2024-01-02', only_empty=False)) == 1
+    assert len(repo.archived_pages(until='2024-01-01', only_empty=False)) == 1
+
+    repo.update_archived_page(empty, 2)
+    assert repo.archived_pages() == []
+
+def test_data_generation_moves_on_in_place_rewrites(repo):
+    target = repo.save_product_data('https://example.com/a', product('Mléko', discount('Lidl', 20, amount='1 l')),
+                                    '2024-01-01T10:00:00')
+    duplicate = repo.save_product_data('https://example.com/b', product('Mléko'), '2024-01-01T10:00:00')
+    generation = repo.data_generation()
+
+    repo.save_product_data('https://example.com/a', product('Mléko', discount('Lidl', 21)), '2024-01-02T10:00:00')
+    repo.apply_unit_updates([('1 l', 1000.0, 'ml')], dry_run=True)
+    assert repo.data_generation() == generation
+
+    repo.apply_unit_updates([('1 l', 1000.0, 'ml')])
+    assert repo.data_generation() == generation + 1
+    repo.apply_unit_updates([('1 l', 1000.0, 'ml')])
+    assert repo.data_generation() == generation + 1
+
+    repo.merge_products(target, [duplicate])
+    assert repo.data_generation() == generation + 2
+
+def test_postgres_history_ids_follow_commit_order(repo):
+    if isinstance(repo, SQLiteRepository):
+        pytest.skip('SQLite has a single writer')
+    import psycopg
+    from storage_postgres import INGEST_LOCK
+
+    product_id = repo.save_product_data('https://example.com/a', product('Tuňák'), '2024-01-01T10:00:00')
+    with psycopg.connect(repo.pool.conninfo) as writer:
+        # An ingest in flight: it holds a lower id but has not committed yet
+        writer.execute('SELECT pg_advisory_xact_lock(%s)', (INGEST_LOCK,))
+        writer.execute("INSERT INTO price_history (product_id, shop_name, price, fetch_timestamp) "
+                       "VALUES (%s, 'Lidl', 30, '2024-01-02T10:00:00')", (product_id,))
+
+        later = threading.Thread(target=repo.save_product_data, args=(
+            'https://example.com/a', product('Tuňák', discount('Tesco', 25)), '2024-01-02T10:00:00'))
+        later.start()
+        later.join(timeout=1)
+        # The second writer waits instead of committing a higher id first
+        assert later.is_alive()
+        assert repo.history_since(0) == []
+
+    later.join(timeout=10)
+    assert [row['shop_name'] for row in repo.history_since(0)] == ['Lidl', 'Tesco']
+
+def test_cheapest_deals_name_ignores_case_and_diacritics(repo):
+    repo.save_product_data('https://example.com/a', product('Čokoláda Studentská pečeť', discount('Lidl', 30)),
+                           '2024-01-01T10:00:00')
+    repo.save_product_data('https://example.com/b', product('Tuňák v oleji', discount('Lidl', 25)),
+                           '2024-01-01T10:00:00')
+
+    for query in ('čokoláda', 'Čokoláda', 'COKOLADA', 'studentska pecet'):
+        assert [deal['product_name'] for deal in repo.cheapest_deals(name_query=query)] == [
+            'Čokoláda Studentská pečeť'
+        ]
+
+def test_sqlite_setup_backfills_search_name(tmp_path):
+    path = str(tmp_path / 'old.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE products (id INTEGER PRIMARY KEY, url TEXT UNIQUE, name TEXT)')
+        conn.execute("INSERT INTO products (url, name) VALUES ('https://example.com/a', 'Čokoláda')")
+    repo = SQLiteRepository(path)
+    repo.setup()
+    repo.save_product_data('https://example.com/a', product('Čokoláda', discount('Lidl', 30)),
+                           '2024-01-01T10:00:00')
+
+    assert [deal['shop_name'] for deal in repo.cheapest_deals(name_query='čokoláda')] == ['Lidl']
@@ -0,0 +1,124 @@
+# test_scraper.py
+import pytest
+
+import scraper
+from sources import Source
+from storage import SQLiteRepository
+
+PAGES = {
+    'https://shop-a.example/tunak': {
+        'name': 'Tuňák v oleji Rio Mare 160g',
+        'discounts': [
+            {'shop_name': 'Albert', 'price': '39,90 Kč', 'amount': '160 g', 'price_per_gram': 39.9 / 160,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'všechny', 'additional_note': ''},
+            {'shop_name': 'Tesco', 'price': '44,90 Kč', 'amount': '160 g', 'price_per_gram': 44.9 / 160,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'všechny', 'additional_note': ''},
+        ]
+    },
+    'https://shop-b.example/rio-mare-tunak': {
+        'name': 'Tuňák v oleji Rio Mare',
+        'discounts': [
+            {'shop_name': 'Lidl', 'price': '42,90 Kč', 'amount': '160 g', 'price_per_gram': 42.9 / 160,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'všechny', 'additional_note': ''},
+        ]
+    },
+    # The same price in two regions, and once more with a note
+    'https://shop-c.example/maslo': {
+        'name': 'Máslo 250g',
+        'discounts': [
+            {'shop_name': 'Billa', 'price': '49,90 Kč', 'amount': '250 g', 'price_per_gram': 49.9 / 250,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'Praha', 'additional_note': ''},
+            {'shop_name': 'Billa', 'price': '49,90 Kč', 'amount': '250 g', 'price_per_gram': 49.9 / 250,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'Brno', 'additional_note': ''},
+            {'shop_name': 'Billa', 'price': '49,90 Kč', 'amount': '250 g', 'price_per_gram': 49.9 / 250,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'Brno', 'additional_note': 's kartou'},
+        ]
+    },
+    # An aggregator listing the first page's Albert offer again, plus its own
+    'https://aggregator.example/tunak-rio-mare': {
+        'name': 'Tuňák v oleji Rio Mare 160 g',
+        'discounts': [
+            {'shop_name': 'Albert', 'price': '39,90 Kč', 'amount': '160 g', 'price_per_gram': 39.9 / 160,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'vybrané', 'additional_note': ''},
+            {'shop_name': 'Billa', 'price': '41,90 Kč', 'amount': '160 g', 'price_per_gram': 41.9 / 160,
+             'unit': 'g', 'expiration': 'do 31.12.', 'shops_valid': 'všechny', 'additional_note': ''},
+        ]
+    }
+}
+
+class PageSource(Source):
+    """Serves PAGES without touching the network"""
+
+    name = 'test'
+
+    def __init__(self, urls):
+        self.product_urls = urls
+
+    def fetch(self, url):
+        return url.encode()
+
+    def parse_listing(self, html, url):
+        return []
+
+    def parse_product(self, html, url):
+        page = PAGES[html.decode()]
+        return {'name': page['name'], 'discounts': [dict(d) for d in page['discounts']]}
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repository = SQLiteRepository(str(tmp_path / 'test.db'))
+    monkeypatch.setattr(scraper, 'get_repository', lambda: repository)
+    monkeypatch.setattr(scraper, 'store_page', lambda html: '0' * 64)
+    return repository
+
+def test_aliased_urls_keep_all_latest_deals(repo):
+    first_url, second_url, _, _ = PAGES
+    # The first URL becomes the product; the second is matched to it by name
+    scraper.scrape_all_products([PageSource([first_url])])
+    scraper.scrape_all_products([PageSource([first_url, second_url])])
+
+    product_id = repo.product_id_for_url(first_url)
+    assert repo.product_id_for_url(second_url) == product_id
+    assert len(repo.list_products()) == 1
+
+    deals = repo.latest_deals(product_id, limit=10)
+    assert sorted(deal['shop_name'] for deal in deals) == ['Albert', 'Lidl', 'Tesco']
+    assert [shop['shop_name'] for shop in repo.basket_cost_by_shop([product_id])] == ['Albert', 'Lidl', 'Tesco']
+    assert sorted(shop['shop_name'] for shop in repo.shop_leaderboard()) == ['Albert', 'Lidl', 'Tesco']
+
+def test_failed_save_leaves_page_replayable(repo, monkeypatch):
+    first_url, second_url, _, _ = PAGES
+    save_product_data = repo.save_product_data
+
+    def save_unless_locked(url, product_data, timestamp):
+        if url == first_url:
+            raise RuntimeError('database is locked')
+        return save_product_data(url, product_data, timestamp)
+    monkeypatch.setattr(repo, 'save_product_data', save_unless_locked)
+
+    scraper.scrape_all_products([PageSource([first_url, second_url])])
+
+    pages = sorted(repo.archived_pages(only_empty=False), key=lambda page: page['url'])
+    assert [(page['url'], page['sha256'], page['rows_saved']) for page in pages] == [
+        (first_url, '0' * 64, 0), (second_url, '0' * 64, 1)
+    ]
+
+def test_same_offer_from_two_sources_is_saved_once(repo):
+    first_url, _, _, aggregator_url = PAGES
+    scraper.scrape_all_products([PageSource([first_url]), PageSource([aggregator_url])])
+
+    product_id = repo.product_id_for_url(first_url)
+    assert repo.product_id_for_url(aggregator_url) == product_id
+    deals = repo.latest_deals(product_id, limit=10)
+    assert sorted(deal['shop_name'] for deal in deals) == ['Albert', 'Billa', 'Tesco']
+    # Both pages parsed, so neither is left for archive.py to replay
+    assert repo.archived_pages() == []
+
+def test_rows_differing_by_region_or_note_are_all_saved(repo):
+    _, _, butter_url, _ = PAGES
+    scraper.scrape_all_products([PageSource([butter_url])])
+
+    deals = repo.latest_deals(repo.product_id_for_url(butter_url), limit=10)
+    assert sorted((deal['shops_valid'], deal['additional_note']) for deal in deals) == [
+        ('Brno', ''), ('Brno', 's kartou'), ('Praha', '')
+    ]
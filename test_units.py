@@ -0,0 +1,42 @@
+# test_units.py
+import pytest
+
+from units import parse_amount, parse_price, parse_quantity, price_per_unit
+
+@pytest.mark.parametrize('amount, expected', [
+    ('160 g', (160.0, 'g')),
+    ('1 kg', (1000.0, 'g')),
+    ('25 dkg', (250.0, 'g')),
+    ('0,5 l', (500.0, 'ml')),
+    ('330 ml', (330.0, 'ml')),
+    ('6x100 g', (600.0, 'g')),
+    ('4 × 1,5 l', (6000.0, 'ml')),
+    ('10 ks', (10.0, 'ks')),
+    ('1 000 g', (1000.0, 'g')),
+    ('1\u00a0000 g', (1000.0, 'g')),
+    ('2\u202f500 ml', (2500.0, 'ml')),
+    ('250', (250.0, 'g')),
+    ('N/A', (0.0, 'g')),
+    ('', (0.0, 'g')),
+])
+def test_parse_quantity(amount, expected):
+    assert parse_quantity(amount) == expected
+
+def test_parse_amount():
+    assert parse_amount('1,5 kg') == 1500.0
+
+@pytest.mark.parametrize('price, expected', [
+    ('29,90 Kč', 29.9),
+    ('29.90', 29.9),
+    ('1 299,90 Kč', 1299.9),
+    ('1\u00a0299,90 Kč', 1299.9),
+    ('N/A', 0.0),
+])
+def test_parse_price(price, expected):
+    assert parse_price(price) == expected
+
+def test_price_per_unit():
+    assert price_per_unit(50.0, '1 kg') == (0.05, 'g')
+    assert price_per_unit(30.0, '10 ks') == (3.0, 'ks')
+    # Nothing to divide by: no price per unit rather than an error
+    assert price_per_unit(30.0, 'N/A') == (0, 'g')
@@ -0,0 +1,71 @@
+# units.py
+import re
+from functools import lru_cache
+from typing import Tuple
+
+# Base unit every amount is normalized to, with the factor from each spelling
+UNIT_FACTORS = {
+    'mg': ('g', 0.001),
+    'g': ('g', 1.0),
+    'dkg': ('g', 10.0),
+    'kg': ('g', 1000.0),
+    'ml': ('ml', 1.0),
+    'cl': ('ml', 10.0),
+    'dl': ('ml', 100.0),
+    'l': ('ml', 1000.0),
+    'ks': ('ks', 1.0),
+}
+
+# e.g. "29,90", "29.90", "1 299,90" (thousands split by regular or non-breaking spaces)
+_NUMBER = r'\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?'
+# e.g. "160 g", "1 kg", "0,5 l", "6x100 g", "7x 80 g", "4 × 1,5 l", "10 ks", "1 000 g"
+_AMOUNT_RE = re.compile(
+    r'(?:(\d+)\s*[x×]\s*)?(' + _NUMBER + r')\s*(mg|dkg|kg|g|ml|cl|dl|l|ks)\b',
+    re.IGNORECASE
+)
+_NUMBER_RE = re.compile(_NUMBER)
+_SPACES_RE = re.compile(r'[ \u00a0\u202f]')
+
+
+def _to_float(number: str) -> float:
+    return float(_SPACES_RE.sub('', number).replace(',', '.'))
+
+
+@lru_cache(maxsize=4096)
+def parse_quantity(amount_str: str) -> Tuple[float, str]:
+    """Normalize an amount string to (quantity, base unit).
+
+    '1 kg' -> (1000.0, 'g'), '6x100 g' -> (600.0, 'g'), '0,5 l' -> (500.0, 'ml').
+    A bare number is treated as grams; an unparseable string gives (0.0, 'g').
+    """
+    match = _AMOUNT_RE.search(amount_str)
+    if match:
+        count, value, unit = match.groups()
+        base_unit, factor = UNIT_FACTORS[unit.lower()]
+        quantity = _to_float(value) * factor * (int(count) if count else 1)
+        return quantity, base_unit
+
+    match = _NUMBER_RE.search(amount_str)
+    if match:
+        return _to_float(match.group(0)), 'g'
+    return 0.0, 'g'
+
+
+def parse_amount(amount_str: str) -> float:
+    """Extract the amount in base units (e.g., '1 kg' -> 1000.0)"""
+    return parse_quantity(amount_str)[0]
+
+
+@lru_cache(maxsize=4096)
+def parse_price(price_str: str) -> float:
+    """Convert price string to float (e.g., '29,90 Kč' -> 29.90)"""
+    match = _NUMBER_RE.search(price_str)
+    if match:
+        return _to_float(match.group(0))
+    return 0.0
+
+
+def price_per_unit(price: float, amount_str: str) -> Tuple[float, str]:
+    """Price per base unit (gram, millilitre or piece) for a deal"""
+    quantity, unit = parse_quantity(amount_str)
+    return (price / quantity if quantity > 0 else 0), unit